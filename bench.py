@@ -0,0 +1,211 @@
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import types
+
+import pygame as pg
+
+import musou_kokaton as mk
+
+
+SCENARIOS = {}  # シナリオ名と(準備関数, 入力)の辞書
+
+
+def scenario(name: str, policy):
+    """
+    準備関数をシナリオとして登録するデコレータ
+    引数1 name：シナリオ名
+    引数2 policy：policy(game)で(key_lst, shots)を返す入力
+    """
+    def register(setup):
+        SCENARIOS[name] = setup, policy
+        return setup
+    return register
+
+
+# 上下に動きながら5フレームごとに撃つ入力
+SHOOTING = mk.Script([
+    (5, (pg.K_UP,), True), (20, (pg.K_UP,), False),
+    (5, (pg.K_DOWN,), True), (20, (pg.K_DOWN,), False),
+])
+# 右を向いたまま2フレームごとに撃つ入力（3方向ビームの連射用）
+RAPID = mk.Script([(1, (pg.K_RIGHT,), True), (1, (), False)])
+
+
+def immortal(game: mk.Game):
+    """
+    計測を最後まで続けるため，残機とボスのヒットポイントを十分大きくする
+    """
+    game.zanki.zanki = 10**6
+    game.boss_hp.boss_hp = 10**6
+
+
+@scenario("early", SHOOTING)
+def setup_early(game: mk.Game):
+    """
+    開始直後の雑魚敵だけの状態
+    """
+    immortal(game)
+
+
+@scenario("enemy2", SHOOTING)
+def setup_enemy2(game: mk.Game):
+    """
+    敵を10体倒してEnemy2が出現する状態
+    """
+    immortal(game)
+    game.enemies_killed = 10
+
+
+@scenario("boss", SHOOTING)
+def setup_boss(game: mk.Game):
+    """
+    敵を30体より多く倒してボスが5フレームごとに爆弾を撃つ状態
+    """
+    immortal(game)
+    game.enemies_killed = 31
+
+
+@scenario("triple", RAPID)
+def setup_triple(game: mk.Game):
+    """
+    スコア200以上で3方向ビームを連射する状態
+    """
+    immortal(game)
+    game.score.score = 200
+
+
+def refill_bombs(game: mk.Game, count: int):
+    """
+    画面内のランダムな位置から飛行機に向かう爆弾を，生きている爆弾がcount個になるまで追加する
+    """
+    rng = game.rng
+    for _ in range(count-len(game.bombs)):
+        src = types.SimpleNamespace(rect=pg.Rect(rng.randint(100, mk.WIDTH-200), rng.randint(100, mk.HEIGHT-200), 1, 1))
+        if src.rect.center != game.plane.rect.center:
+            game.bombs.add(mk.Bomb.acquire(src, game.plane, rng))
+
+
+@scenario("stress", mk.null_input)
+def setup_stress(game: mk.Game):
+    """
+    数千個の爆弾が常に飛び交う合成シナリオ（毎フレーム補充する）
+    """
+    immortal(game)
+    game.stress = 3000
+    refill_bombs(game, game.stress)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    valuesのq百分位数（最近接順位法）を返す
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = max(0, min(len(ordered)-1, math.ceil(q/100*len(ordered))-1))
+    return ordered[k]
+
+
+def run_scenario(name: str, frames: int, seed: int, soa: bool, render: bool, screen: pg.Surface) -> dict:
+    """
+    シナリオnameをframesフレーム動かし，フレーム時間の統計を返す
+    引数1 name：シナリオ名
+    引数2 frames：計測するフレーム数
+    引数3 seed：乱数の種
+    引数4 soa：Trueなら弾をProjectileGroupに入れる
+    引数5 render：Trueなら描画とディスプレイ更新も計測する
+    引数6 screen：画面Surface
+    戻り値：フレーム時間（ミリ秒）の百分位数，シミュレーションと描画の内訳，スプライト数の最大値の辞書
+    """
+    setup, policy = SCENARIOS[name]
+    game = mk.Game(random.Random(seed), soa)
+    setup(game)
+    renderer = mk.Renderer(screen, mk.BgScroller(mk.ASSETS.load("fig/Uchu.jpg")).draw)
+    groups = {n: getattr(game, n) for n in ("beams", "bombs", "bossbombs", "emys", "emys2", "bosses", "exps", "items")}
+    peaks = dict.fromkeys(groups, 0)
+    sims, draws, totals = [], [], []
+    for _ in range(frames):
+        if hasattr(game, "stress"):
+            refill_bombs(game, game.stress)
+        key_lst, shots = policy(game)
+        t0 = time.perf_counter()
+        result = game.step(key_lst, shots)
+        t1 = time.perf_counter()
+        if render:
+            renderer.render(game.tmr-1, game.layers)
+        t2 = time.perf_counter()
+        sims.append((t1-t0)*1000)
+        draws.append((t2-t1)*1000)
+        totals.append((t2-t0)*1000)
+        for n, group in groups.items():
+            peaks[n] = max(peaks[n], len(group))
+        if result is not None:
+            break
+    game.close()
+    summary = {"frames": len(totals), "result": result, "peak_sprites": peaks}
+    for key, values in (("frame_ms", totals), ("sim_ms", sims), ("render_ms", draws)):
+        summary[key] = {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "mean": sum(values)/len(values) if values else 0.0,
+        }
+    return summary
+
+
+def compare(old: dict, new: dict):
+    """
+    2つの結果ファイルのp50，p95，p99フレーム時間を並べて表示する
+    """
+    for name, res in new["scenarios"].items():
+        base = old["scenarios"].get(name)
+        if base is None:
+            continue
+        cells = []
+        for q in ("p50", "p95", "p99"):
+            a, b = base["frame_ms"][q], res["frame_ms"][q]
+            cells.append(f"{q} {a:.2f}->{b:.2f}ms ({b/a if a else 0:.2f}x)")
+        print(f"{name:8s} " + "  ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="宇宙シューティングのシナリオ別ベンチマーク")
+    parser.add_argument("--frames", type=int, default=1000, help="シナリオごとに計測するフレーム数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数の種")
+    parser.add_argument("--soa", action="store_true", help="弾をProjectileGroupに入れる")
+    parser.add_argument("--no-render", action="store_true", help="描画を行わずシミュレーションだけを計測する")
+    parser.add_argument("--only", nargs="*", choices=sorted(SCENARIOS), help="実行するシナリオ")
+    parser.add_argument("--out", default="bench_results.json", help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", metavar="OLD", help="比較する以前の結果ファイル")
+    args = parser.parse_args()
+
+    screen = mk.setup_display(headless=True)
+    results = {
+        "python": platform.python_version(),
+        "pygame": pg.version.ver,
+        "options": {"frames": args.frames, "seed": args.seed, "soa": args.soa, "render": not args.no_render},
+        "scenarios": {},
+    }
+    for name in args.only or SCENARIOS:
+        res = run_scenario(name, args.frames, args.seed, args.soa, not args.no_render, screen)
+        results["scenarios"][name] = res
+        ms = res["frame_ms"]
+        print(f"{name:8s} p50 {ms['p50']:.2f}ms  p95 {ms['p95']:.2f}ms  p99 {ms['p99']:.2f}ms  "
+              f"sim {res['sim_ms']['mean']:.2f}ms  render {res['render_ms']['mean']:.2f}ms  "
+              f"peak bombs {res['peak_sprites']['bombs']}  beams {res['peak_sprites']['beams']}")
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), results)
+    pg.quit()
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit()
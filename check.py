@@ -0,0 +1,162 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+import pygame as pg
+
+import bench
+import musou_kokaton as mk
+from selfplay import Bot
+
+
+class PygameHit:
+    """
+    SpatialHashの代わりにpg.sprite.groupcollide，spritecollideをそのまま呼ぶ基準の衝突判定
+    """
+    def build(self, groups: list[pg.sprite.AbstractGroup]):
+        pass
+
+    @staticmethod
+    def spritecollide(sprite: pg.sprite.Sprite, group: pg.sprite.AbstractGroup, dokill: bool) -> list[pg.sprite.Sprite]:
+        return pg.sprite.spritecollide(sprite, group, dokill)
+
+    @staticmethod
+    def groupcollide(groupa: pg.sprite.AbstractGroup, groupb: pg.sprite.AbstractGroup,
+                     dokilla: bool, dokillb: bool) -> dict[pg.sprite.Sprite, list[pg.sprite.Sprite]]:
+        return pg.sprite.groupcollide(groupa, groupb, dokilla, dokillb)
+
+
+def random_group(rng: random.Random, n: int) -> pg.sprite.Group:
+    """
+    画面内のランダムな位置と大きさのスプライトをn個入れたグループを返す
+    """
+    group = pg.sprite.Group()
+    for _ in range(n):
+        spr = pg.sprite.Sprite()
+        spr.rect = pg.Rect(rng.randint(-50, mk.WIDTH), rng.randint(-50, mk.HEIGHT), rng.randint(1, 200), rng.randint(1, 200))
+        group.add(spr)
+    return group
+
+
+def check_collide(runs: int, seed: int) -> list[str]:
+    """
+    ランダムなグループでSpatialHashとpygameの衝突判定を比べ，食い違いの説明のリストを返す
+    どちらも同じ位置のスプライトの組で判定し，返る組と順序，判定後にグループに残るスプライトを比べる
+    """
+    errors = []
+    for run in range(runs):
+        rng = random.Random(seed+run)
+        sizes = rng.randint(0, 60), rng.randint(0, 60)
+        dokill = rng.random() < 0.5, rng.random() < 0.5
+        results = []
+        for hit in (PygameHit(), mk.SpatialHash(rng.choice((32, 64, 128, 256)))):
+            shapes = random.Random(f"{seed}-{run}")  # どちらの判定にも同じ位置のグループを作る
+            a, b = random_group(shapes, sizes[0]), random_group(shapes, sizes[1])
+            hit.build([b])
+            pairs = hit.groupcollide(a, b, *dokill)
+            probe = a.sprites()[0] if a else None
+            single = hit.spritecollide(probe, b, dokill[1]) if probe is not None else []
+            results.append((
+                [(tuple(k.rect), [tuple(s.rect) for s in v]) for k, v in pairs.items()],
+                [tuple(s.rect) for s in single],
+                [tuple(s.rect) for s in a], [tuple(s.rect) for s in b],
+            ))
+        if results[0] != results[1]:
+            errors.append(f"collide run {run}: SpatialHashの結果がpygameと異なる（sizes={sizes}, dokill={dokill}）")
+    return errors
+
+
+def check_engine(frames: int, seed: int) -> list[str]:
+    """
+    各シナリオで，pygameの衝突判定を使う基準のGameと，SpatialHashのGame，ProjectileGroupのGameを
+    同じ入力で並べて進め，毎フレームのsummary()を比べる．食い違いの説明のリストを返す
+    """
+    errors = []
+    policies = {name: policy for name, (setup, policy) in bench.SCENARIOS.items() if name != "stress"}
+    policies["bot"] = Bot()
+    for name, policy in policies.items():
+        setup = bench.SCENARIOS[name][0] if name in bench.SCENARIOS else None
+        games = {}
+        for label, soa in (("baseline", False), ("hash", False), ("soa", True)):
+            if soa and mk.np is None:
+                continue
+            game = mk.Game(random.Random(seed), soa)
+            if label == "baseline":
+                game.hit = PygameHit()
+            if setup is not None:
+                setup(game)
+            games[label] = game
+        base = games["baseline"]
+        for _ in range(frames):
+            key_lst, shots = policy(base)
+            results = {label: game.step(key_lst, shots) for label, game in games.items()}
+            expect = base.summary(), results["baseline"]
+            wrong = [label for label, game in games.items() if (game.summary(), results[label]) != expect]
+            if wrong:
+                errors.append(f"engine {name}: フレーム{base.tmr}で{', '.join(wrong)}が基準と異なる")
+                break
+            if results["baseline"] is not None:
+                break
+        for game in games.values():
+            game.close()
+    return errors
+
+
+def check_replay(frames: int, seed: int) -> list[str]:
+    """
+    Botのプレイを記録してファイルに書き出し，読み込んで再生した結果が記録時と一致するか調べる
+    食い違いの説明のリストを返す
+    """
+    game = mk.Game(random.Random(seed))
+    bot = Bot()
+    replay = mk.Replay(seed)
+    result = None
+    while game.tmr < frames and result is None:
+        key_lst, shots = bot(game)
+        replay.record(key_lst, shots)
+        result = game.step(key_lst, shots)
+    expect = game.summary()
+    game.close()
+    replay.checksum = expect["checksum"]
+    fd, path = tempfile.mkstemp(suffix=".rep")
+    os.close(fd)
+    try:
+        replay.save(path)
+        loaded = mk.Replay.load(path)
+    finally:
+        os.remove(path)
+    errors = []
+    if (loaded.seed, loaded.checksum, loaded.ticks) != (replay.seed, replay.checksum, replay.ticks):
+        errors.append("replay: 読み込んだリプレイが書き出したものと異なる")
+    for soa in (False, True) if mk.np is not None else (False,):
+        report = mk.run_headless(len(loaded), loaded.seed, loaded, soa=soa)
+        got = {key: report[key] for key in expect}
+        if got != expect:
+            errors.append(f"replay soa={soa}: 再生結果{got}が記録時{expect}と異なる")
+    return errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="衝突判定・弾の配列化・リプレイが元の進行と一致するかの確認")
+    parser.add_argument("--runs", type=int, default=300, help="衝突判定を比べるランダムなグループの組数")
+    parser.add_argument("--frames", type=int, default=3000, help="シナリオとリプレイで進める最大フレーム数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数の種")
+    args = parser.parse_args()
+
+    mk.setup_display(headless=True)
+    errors = []
+    for label, check, arg in (("collide", check_collide, args.runs), ("engine", check_engine, args.frames),
+                              ("replay", check_replay, args.frames)):
+        found = check(arg, args.seed)
+        print(f"{label:8s} {'ok' if not found else 'NG'}")
+        errors += found
+    for error in errors:
+        print(error)
+    pg.quit()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
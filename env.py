@@ -0,0 +1,248 @@
+import random
+
+import numpy as np
+import pygame as pg
+
+import musou_kokaton as mk
+
+
+ACTIONS = [(move, fire) for fire in (False, True) for move in mk.MOVES]  # 行動番号ごとの(移動方向, 発射するかどうか)
+N_BOMBS, N_ENEMIES, N_ITEMS = 8, 4, 2  # 特徴ベクトルに入れる近い順の爆弾，敵機，アイテムの数
+ENEMY_KINDS = {mk.Enemy: 1, mk.Enemy2: 2, mk.Boss: 3}  # 特徴ベクトルでの敵の種類
+RENDERER: mk.Renderer | None = None  # 画面の観測で全ShooterEnvが共有するRenderer
+
+
+def shared_renderer(screen: pg.Surface) -> mk.Renderer:
+    """
+    screenに背景とスプライトを描くRendererを返す
+    全ShooterEnvが同じ画面に順に描くので，背景の帯（画像幅の2倍）を含めて1つだけ作って共有する
+    """
+    global RENDERER
+    if RENDERER is None or RENDERER.screen is not screen:
+        RENDERER = mk.Renderer(screen, mk.BgScroller(mk.ASSETS.load("fig/Uchu.jpg")).draw)
+    return RENDERER
+
+
+class PixelObserver:
+    """
+    画面Surfaceをpg.surfarray.pixels3dでコピーせずに参照し，間引きとグレースケール化をして
+    渡された配列（または事前に確保した配列）に書き込むクラス
+    """
+    def __init__(self, screen: pg.Surface, downsample: int = 4, gray: bool = False):
+        """
+        引数1 screen：観測する画面Surface
+        引数2 downsample：縦横をこの間隔で間引く（1なら間引かない）
+        引数3 gray：Trueならグレースケールにする
+        """
+        self.screen = screen
+        self.step = downsample
+        self.gray = gray
+        w, h = screen.get_size()
+        self.shape = (len(range(0, h, downsample)), len(range(0, w, downsample))) + (() if gray else (3,))
+        self.out = np.empty(self.shape, np.uint8)  # outを渡されないときの書き込み先
+        if gray:  # 輝度を計算する途中の値（uint8からあふれないようにuint16で持つ）
+            self.acc = np.empty(self.shape, np.uint16)
+            self.tmp = np.empty(self.shape, np.uint16)
+
+    def view(self, rgb: bool = True) -> np.ndarray:
+        """
+        画面のピクセルをコピーせずに参照する配列（幅, 高さ[, 3]）を返す
+        配列がある間はSurfaceがロックされて描画できないので，使い終わったらすぐに捨てること
+        引数 rgb：Trueならpixels3d，Falseならpixels2d（画面のピクセル形式の整数）
+        """
+        return pg.surfarray.pixels3d(self.screen) if rgb else pg.surfarray.pixels2d(self.screen)
+
+    def __call__(self, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        現在の画面を間引いて(高さ, 幅[, 3])のuint8配列outに書き込み，outを返す
+        """
+        if out is None:
+            out = self.out
+        view = self.view()
+        try:
+            k = self.step
+            src = view[::k, ::k].swapaxes(0, 1)  # 間引いて(高さ, 幅, 3)にした参照（コピーしない）
+            if not self.gray:
+                np.copyto(out, src)
+            else:  # ITU-R BT.601の重みを256倍した整数で輝度を計算する
+                acc, tmp = self.acc, self.tmp
+                np.multiply(src[..., 0], 77, out=acc, dtype=np.uint16)
+                np.multiply(src[..., 1], 150, out=tmp, dtype=np.uint16)
+                acc += tmp
+                np.multiply(src[..., 2], 29, out=tmp, dtype=np.uint16)
+                acc += tmp
+                np.right_shift(acc, 8, out=out, casting="unsafe")
+        finally:
+            del view  # Surfaceのロックを外す
+        return out
+
+
+class ShooterEnv:
+    """
+    ウィンドウもフレームレートの制限もなしでゲームを進める，reset()/step(action)形式の環境
+    行動は9通りの移動（動かないを含む）と発射の有無を組み合わせた18通りの番号
+    報酬はスコアの増分，残機が0になるかボスを倒すとエピソードが終わる
+    観測obsは次のどれか
+      "state"：飛行機の位置と向き，残機，無敵状態，弾と敵の数（float32，10要素）
+      "features"：stateの先頭6要素と近い順の爆弾，敵機，アイテムの相対位置など（float32，64要素．描画しない）
+      "rgb"，"gray"：描画した画面をdownsampleごとに間引いたもの（uint8，(高さ, 幅, 3)または(高さ, 幅)）
+    """
+    n_actions = len(ACTIONS)
+
+    def __init__(self, seed: int | None = None, soa: bool = False, max_frames: int = 10000, frame_skip: int = 1,
+                 obs: str = "state", downsample: int = 4):
+        """
+        引数1 seed：最初のエピソードの乱数の種（Noneならランダム）
+        引数2 soa：Trueなら弾をProjectileGroupに入れる
+        引数3 max_frames：1エピソードの最大フレーム数（超えたら打ち切る）
+        引数4 frame_skip：1回のstepで同じ行動を続けるフレーム数（発射は最初のフレームだけ）
+        引数5 obs：観測の種類（"state"，"features"，"rgb"，"gray"）
+        引数6 downsample：画面の観測で縦横を間引く間隔
+        """
+        screen = pg.display.get_surface() or mk.setup_display(headless=True)
+        self.seed = seed
+        self.soa = soa
+        self.max_frames = max_frames
+        self.frame_skip = frame_skip
+        self.obs = obs
+        self.game: mk.Game | None = None
+        self.pixels = None
+        if obs in ("rgb", "gray"):
+            self.pixels = PixelObserver(screen, downsample, obs == "gray")
+            self.renderer = shared_renderer(screen)
+            self.obs_shape, self.obs_dtype = self.pixels.shape, np.uint8
+        elif obs == "features":
+            self.obs_shape, self.obs_dtype = (6+5*N_BOMBS+3*N_ENEMIES+3*N_ITEMS,), np.float32
+        elif obs == "state":
+            self.obs_shape, self.obs_dtype = (10,), np.float32
+        else:
+            raise ValueError(f"観測の種類{obs!r}はありません")
+
+    def reset(self, seed: int | None = None, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        新しいゲームを始め，最初の観測を返す
+        引数1 seed：乱数の種（Noneなら前のエピソードの種+1，最初はコンストラクタのseed）
+        引数2 out：観測を書き込む配列（Noneなら新しく作る）
+        """
+        if seed is None:
+            seed = random.randrange(2**32) if self.seed is None else self.seed
+        self.seed = seed+1
+        if self.game is not None:  # 前のエピソードの弾や爆発をプールに戻す
+            self.game.close()
+        self.game = mk.Game(random.Random(seed), self.soa)
+        return self.observe(out)
+
+    def observe(self, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        現在の観測をout（Noneなら新しい配列）に書き込んで返す
+        """
+        if out is None:
+            out = np.empty(self.obs_shape, self.obs_dtype)
+        game = self.game
+        plane = game.plane
+        if self.pixels is not None:
+            self.renderer.draw_bg(self.renderer.screen, game.tmr)
+            self.renderer.draw_layers(game.layers)
+            return self.pixels(out)
+        head = (plane.rect.centerx/mk.WIDTH, plane.rect.centery/mk.HEIGHT, *plane.dire,
+                game.zanki.zanki, plane.state == "hyper")
+        if self.obs == "state":
+            out[:] = (*head, len(game.bombs), len(game.bossbombs), len(game.emys)+len(game.emys2), len(game.bosses))
+            return out
+        out[:] = 0
+        out[:6] = head
+        cx, cy = plane.rect.center
+        pos = 6
+        # 近い順の爆弾：相対位置，1フレームの移動量，半径
+        rows = [(b.rect.centerx-cx, b.rect.centery-cy, *b.move, b.rect.width/2)
+                for group in (game.bombs, game.bossbombs) for b in group.sprites()]
+        pos = self.nearest(out, pos, rows, N_BOMBS, (mk.WIDTH, mk.HEIGHT, 20, 20, 100))
+        # 近い順の敵機：相対位置，種類
+        rows = [(e.rect.centerx-cx, e.rect.centery-cy, ENEMY_KINDS[type(e)])
+                for group in (game.emys, game.emys2, game.bosses) for e in group]
+        pos = self.nearest(out, pos, rows, N_ENEMIES, (mk.WIDTH, mk.HEIGHT, 1))
+        # 近い順のアイテム：相対位置，回復薬なら1，毒薬なら-1
+        rows = [(i.rect.centerx-cx, i.rect.centery-cy, 1 if i.i else -1) for i in game.items]
+        self.nearest(out, pos, rows, N_ITEMS, (mk.WIDTH, mk.HEIGHT, 1))
+        return out
+
+    @staticmethod
+    def nearest(out: np.ndarray, pos: int, rows: list[tuple], k: int, scale: tuple) -> int:
+        """
+        先頭2列が相対位置の行rowsのうち近いk行をscaleで割ってout[pos:]に書き込み，次の位置を返す
+        足りない分は0のまま残す
+        """
+        width = len(scale)
+        if rows:
+            arr = np.array(rows, np.float32)
+            if len(arr) > k:
+                arr = arr[np.argpartition(arr[:, 0]**2+arr[:, 1]**2, k)[:k]]
+            arr = arr[np.argsort(arr[:, 0]**2+arr[:, 1]**2)]
+            arr /= np.array(scale, np.float32)
+            out[pos:pos+arr.size] = arr.ravel()
+        return pos+k*width
+
+    def step(self, action: int, out: np.ndarray | None = None) -> tuple[np.ndarray, float, bool, dict]:
+        """
+        行動actionでframe_skipフレーム進める
+        引数1 action：行動番号（0～n_actions-1）
+        引数2 out：観測を書き込む配列（Noneなら新しく作る）
+        戻り値：(観測, 報酬, 終了したかどうか, 情報の辞書)．情報には終了理由"result"と打ち切り"truncated"が入る
+        """
+        game = self.game
+        move, fire = ACTIONS[action]
+        keys = mk.MOVE_KEYS[move]
+        before = game.score.score
+        result = None
+        for i in range(self.frame_skip):
+            result = game.step(keys, int(fire and i == 0))
+            if result is not None:
+                break
+        truncated = result is None and game.tmr >= self.max_frames
+        info = {"result": result, "truncated": truncated, "frames": game.tmr, "score": game.score.score}
+        return self.observe(out), float(game.score.score-before), result is not None or truncated, info
+
+
+class VecShooterEnv:
+    """
+    独立したn個のShooterEnvをまとめて進め，観測・報酬・終了フラグをNumPy配列に積んで返す環境
+    終了したゲームは自動でresetし，最後の観測を情報の"final_obs"に入れる
+    観測は各ShooterEnvが事前に確保した(n, ...)の配列の行に直接書き込む
+    """
+    def __init__(self, n: int, seed: int = 0, **kwargs):
+        """
+        引数1 n：同時に進めるゲーム数
+        引数2 seed：i番目のゲームの乱数の種はseed+i*1000003から始める
+        引数3 kwargs：ShooterEnvに渡す引数
+        """
+        self.envs = [ShooterEnv(seed+i*1000003, **kwargs) for i in range(n)]
+        self.obs = np.zeros((n, *self.envs[0].obs_shape), self.envs[0].obs_dtype)
+        self.rewards = np.zeros(n, np.float32)
+        self.dones = np.zeros(n, bool)
+
+    def __len__(self) -> int:
+        return len(self.envs)
+
+    def reset(self) -> np.ndarray:
+        """
+        全ゲームを始め直し，観測を(n, ...)の配列で返す
+        """
+        for i, env in enumerate(self.envs):
+            env.reset(out=self.obs[i])
+        return self.obs.copy()
+
+    def step(self, actions) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[dict]]:
+        """
+        i番目のゲームを行動actions[i]で進める
+        戻り値：(観測(n, ...), 報酬(n,), 終了フラグ(n,), 情報のリスト)
+        """
+        infos = []
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            obs, reward, done, info = env.step(int(action), out=self.obs[i])
+            if done:
+                info["final_obs"] = obs.copy()
+                env.reset(out=obs)
+            self.rewards[i] = reward
+            self.dones[i] = done
+            infos.append(info)
+        return self.obs.copy(), self.rewards.copy(), self.dones.copy(), infos
@@ -1,14 +1,33 @@
+import argparse
+import collections
+import itertools
+import heapq
+import json
+import logging
 import math
+import os
 import random
 import sys
 import time
+import zlib
+
+IMPORT_START = time.perf_counter()  # 起動時間の計測の基準（pygameの読み込みを含める）
 
 import pygame as pg
-from pygame.sprite import AbstractGroup
+
+try:
+    import numpy as np
+except ImportError:  # NumPyがなければProjectileGroupだけが使えない
+    np = None
 
 
 WIDTH = 1600  # ゲームウィンドウの幅
 HEIGHT = 900  # ゲームウィンドウの高さ
+TICK = 1/50  # ゲームを1フレーム進める間隔（秒）．移動量や出現間隔はこの1ステップ単位
+MAX_STEPS = 5  # 1回の描画までに進める最大ステップ数（処理落ちが連鎖して止まらなくなるのを防ぐ）
+log = logging.getLogger(__name__)
+ROOT = os.path.dirname(os.path.abspath(__file__))  # 画像ファイルを置いているディレクトリ
+STARTUP: dict[str, float] = {}  # 起動処理ごとの時間（秒）
 
 
 def check_bound(obj: pg.Rect) -> tuple[bool, bool]:
@@ -37,6 +56,553 @@ def calc_orientation(org: pg.Rect, dst: pg.Rect) -> tuple[float, float]:
     return x_diff/norm, y_diff/norm
 
 
+def frame_move(*moves: tuple[float, float]) -> tuple[int, int]:
+    """
+    move_ipを順に呼んだときの1フレームの合計移動量を返す
+    move_ipと同じく，1回ごとの移動量を0方向に切り捨てて整数にする
+    引数 moves：move_ipに渡す移動量タプル
+    戻り値：横方向，縦方向の合計移動量
+    """
+    return sum(int(x) for x, _ in moves), sum(int(y) for _, y in moves)
+
+
+class Animation:
+    """
+    一度だけ用意したフレーム画像の列（スプライトシート）を共有し，経過時間から表示するフレームを選ぶアニメーション
+    再生速度は1秒あたりのフレーム数で決めるので，ゲームループや描画の回る速さによらない
+    スプライト側は共有のAnimationと経過時間だけを持てばよい
+    """
+    __slots__ = ("frames", "fps")
+
+    def __init__(self, frames: list[pg.Surface], fps: float):
+        """
+        引数1 frames：表示順のフレーム画像（共有Surface）
+        引数2 fps：1秒あたりに進めるフレーム数
+        """
+        self.frames = frames
+        self.fps = fps
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def frame(self, seconds: float, loop: bool = True) -> pg.Surface:
+        """
+        再生開始からseconds秒後に表示するフレーム画像を返す
+        引数1 seconds：再生開始からの経過時間（秒）
+        引数2 loop：Trueなら最後のフレームの後は最初に戻り，Falseなら最後のフレームで止まる
+        """
+        i = int(seconds*self.fps)
+        n = len(self.frames)
+        return self.frames[i%n if loop else min(i, n-1)]
+
+
+class Assets:
+    """
+    画像ファイルを一度だけデコードし，共有Surfaceを各スプライトに配るレジストリ
+    """
+    def __init__(self):
+        self.surfaces: dict[str, pg.Surface] = {}  # パスとデコード済みSurfaceの辞書
+        self.variants: dict[tuple, pg.Surface] = {}  # (パス, 角度, 倍率, 反転)と変形済みSurfaceの辞書
+        self.circles: dict[tuple, pg.Surface] = {}  # (種類, 半径, 色)と描画済み円Surfaceの辞書
+        self.animations: dict[tuple, Animation] = {}  # (パス, フレームレート)と作成済みAnimationの辞書
+        self.hits = 0  # キャッシュから返した回数
+        self.misses = 0  # ファイルを読み込んだ回数
+        self.seconds = 0.0  # ファイルの読み込みと変換にかかった時間の合計
+
+    @staticmethod
+    def path(name: str) -> str:
+        """
+        ROOTからの相対パスnameを絶対パスにする（実行時のカレントディレクトリによらず読み込めるようにする）
+        """
+        return os.path.join(ROOT, name)
+
+    def load(self, path: str) -> pg.Surface:
+        """
+        pathの画像を返す．初回のみファイルを読み込み，以降は同じSurfaceを返す
+        引数 path：ROOTからの画像ファイルの相対パス
+        戻り値：共有Surface（呼び出し側で書き換えないこと）
+        """
+        img = self.surfaces.get(path)
+        if img is not None:
+            self.hits += 1
+            return img
+        self.misses += 1
+        start = time.perf_counter()
+        img = self.prepare(pg.image.load(self.path(path)))
+        self.seconds += time.perf_counter()-start
+        self.surfaces[path] = img
+        return img
+
+    @staticmethod
+    def prepare(img: pg.Surface) -> pg.Surface:
+        """
+        画像を画面のピクセル形式に変換し，blit時の形式変換をなくす
+        カラーキー付きの画像はconvert＋RLE，アルファ付きはconvert_alpha，それ以外はconvertを使う
+        ウィンドウ生成前は変換できないので，そのまま返す（convert_allで後から変換する）
+        引数 img：変換する画像Surface
+        戻り値：変換後の画像Surface
+        """
+        if pg.display.get_surface() is None:
+            return img
+        colorkey = img.get_colorkey()
+        if colorkey is not None:
+            img = img.convert()
+            img.set_colorkey(colorkey, pg.RLEACCEL)
+        elif img.get_flags() & pg.SRCALPHA:
+            img = img.convert_alpha()
+        else:
+            img = img.convert()
+        return img
+
+    def convert_all(self):
+        """
+        set_modeの直後に呼び，ウィンドウ生成前に読み込んだ画像を画面のピクセル形式に変換する
+        変形画像，円画像，アニメーションは変換前の形式で作られているので破棄し，次の利用時に作り直す
+        """
+        self.surfaces = {path: self.prepare(img) for path, img in self.surfaces.items()}
+        self.variants.clear()
+        self.circles.clear()
+        self.animations.clear()
+
+    def variant(self, path: str, angle: float, scale: float, flip: bool = False) -> pg.Surface:
+        """
+        pathの画像を（左右反転してから）angle度回転・scale倍した画像を返す
+        同じ組み合わせは一度だけrotozoomし，以降は同じSurfaceを返す
+        引数1 path：画像ファイルのパス
+        引数2 angle：回転角度（度）
+        引数3 scale：拡大率
+        引数4 flip：左右反転するかどうか
+        戻り値：共有Surface（呼び出し側で書き換えないこと）
+        """
+        key = (path, round(angle, 3), scale, flip)
+        img = self.variants.get(key)
+        if img is not None:
+            self.hits += 1
+            return img
+        self.misses += 1
+        img = self.load(path)
+        if img.get_colorkey() is not None and pg.display.get_surface() is not None:
+            img = img.convert_alpha()  # カラーキーを透明度に置き換えてから回転させ，縁を透明にする
+        if flip:
+            img = pg.transform.flip(img, True, False)
+        img = self.prepare(pg.transform.rotozoom(img, key[1], scale))
+        self.variants[key] = img
+        return img
+
+    def circle(self, kind: str, rad: int, color: tuple[int, int, int]) -> pg.Surface:
+        """
+        半径radの色colorの円を描いた画像を返す．同じ組み合わせは一度だけ描画する
+        引数1 kind：画像を使う弾の種類（"bomb"，"boss"など）
+        引数2 rad：円の半径
+        引数3 color：円の色
+        戻り値：共有Surface（呼び出し側で書き換えないこと）
+        """
+        key = (kind, rad, color)
+        img = self.circles.get(key)
+        if img is not None:
+            self.hits += 1
+            return img
+        self.misses += 1
+        img = pg.Surface((2*rad, 2*rad))
+        pg.draw.circle(img, color, (rad, rad), rad)
+        img.set_colorkey((0, 0, 0), pg.RLEACCEL)
+        img = self.prepare(img)
+        self.circles[key] = img
+        return img
+
+    def animation(self, path: str, fps: float = 5) -> Animation:
+        """
+        pathの画像をfpsで再生するアニメーションを返す．フレームは一度だけ作り，以降は同じAnimationを返す
+        pg.image.load_animation（pygame-ce）があればGIFの全フレームをデコードする
+        1フレームしか得られないときは，画像と上下左右反転した画像の2フレームにする
+        引数1 path：ROOTからの画像ファイルの相対パス
+        引数2 fps：1秒あたりに進めるフレーム数
+        戻り値：共有Animation（呼び出し側で書き換えないこと）
+        """
+        key = (path, fps)
+        anim = self.animations.get(key)
+        if anim is not None:
+            self.hits += 1
+            return anim
+        self.misses += 1
+        frames = []
+        load_animation = getattr(pg.image, "load_animation", None)
+        if load_animation is not None and path.endswith(".gif"):
+            start = time.perf_counter()
+            frames = [self.prepare(img) for img, _ in load_animation(self.path(path))]
+            self.seconds += time.perf_counter()-start
+        if len(frames) < 2:
+            img = self.load(path)
+            frames = [img, self.prepare(pg.transform.flip(img, True, True))]
+        anim = self.animations[key] = Animation(frames, fps)
+        return anim
+
+    def stats(self) -> dict[str, int]:
+        """
+        キャッシュのヒット数，ミス数，保持している画像数・変形画像数・円画像数・アニメーション数を辞書で返す
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "images": len(self.surfaces),
+            "variants": len(self.variants),
+            "circles": len(self.circles),
+            "animations": len(self.animations),
+            "seconds": self.seconds,
+        }
+
+
+ASSETS = Assets()  # ゲーム全体で共有するアセットレジストリ
+
+
+class SpatialHash:
+    """
+    画面を一様なセルに分けてスプライトを登録し，衝突判定の候補を近くのスプライトに絞るクラス
+    groupcollide，spritecollideと同じ組と同じ順序，同じkillの挙動で結果を返す
+    """
+    def __init__(self, cell: int = 128):
+        """
+        引数 cell：セルの一辺の長さ（ピクセル）
+        """
+        self.cell = cell
+        self.tables: dict[pg.sprite.AbstractGroup, tuple[dict, dict]] = {}  # グループごとの(セル, 順序)
+
+    def cells(self, rect: pg.Rect):
+        """
+        rectが重なるセルの座標を順に返す
+        """
+        c = self.cell
+        for cx in range(rect.left//c, (rect.right-1)//c+1):
+            for cy in range(rect.top//c, (rect.bottom-1)//c+1):
+                yield cx, cy
+
+    def build(self, groups: list[pg.sprite.AbstractGroup]):
+        """
+        groupsの全スプライトをセルに登録し直す．フレームごとに，衝突判定の前に一度だけ呼ぶ
+        引数 groups：衝突判定で相手側になるスプライトグループのリスト
+        """
+        self.tables = {}
+        for group in groups:
+            if isinstance(group, ProjectileGroup):  # 配列で判定できるので登録しない
+                continue
+            cells: dict[tuple[int, int], list[pg.sprite.Sprite]] = {}
+            order: dict[pg.sprite.Sprite, int] = {}  # グループ内での並び順
+            for i, spr in enumerate(group.sprites()):
+                order[spr] = i
+                for key in self.cells(spr.rect):
+                    cells.setdefault(key, []).append(spr)
+            self.tables[group] = cells, order
+
+    def spritecollide(self, sprite: pg.sprite.Sprite, group: pg.sprite.AbstractGroup, dokill: bool) -> list[pg.sprite.Sprite]:
+        """
+        pg.sprite.spritecollideと同じく，spriteと衝突するgroupのスプライトのリストを返す
+        登録後にkillされたスプライトは除外する
+        引数1 sprite：判定するスプライト
+        引数2 group：buildで登録済みのスプライトグループ
+        引数3 dokill：衝突したgroup側のスプライトをkillするかどうか
+        """
+        if isinstance(group, ProjectileGroup):
+            return group.collide_rect(sprite.rect, dokill)
+        cells, order = self.tables[group]
+        rect = sprite.rect
+        found = set()
+        for key in self.cells(rect):
+            for spr in cells.get(key, ()):
+                if spr not in found and spr in group and rect.colliderect(spr.rect):
+                    found.add(spr)
+        crashed = sorted(found, key=order.__getitem__)
+        if dokill:
+            for spr in crashed:
+                spr.kill()
+        return crashed
+
+    def groupcollide(self, groupa: pg.sprite.AbstractGroup, groupb: pg.sprite.AbstractGroup,
+                     dokilla: bool, dokillb: bool) -> dict[pg.sprite.Sprite, list[pg.sprite.Sprite]]:
+        """
+        pg.sprite.groupcollideと同じく，groupaのスプライトと衝突したgroupbのスプライトの辞書を返す
+        引数1 groupa：判定するスプライトグループ
+        引数2 groupb：buildで登録済みのスプライトグループ
+        引数3 dokilla：衝突したgroupa側のスプライトをkillするかどうか
+        引数4 dokillb：衝突したgroupb側のスプライトをkillするかどうか
+        """
+        if isinstance(groupa, ProjectileGroup) and isinstance(groupb, ProjectileGroup):
+            return groupa.groupcollide(groupb, dokilla, dokillb)
+        crashed = {}
+        for spr in groupa.sprites():
+            collision = self.spritecollide(spr, groupb, dokillb)
+            if collision:
+                crashed[spr] = collision
+                if dokilla:
+                    spr.kill()
+        return crashed
+
+
+class ProjectileGroup(pg.sprite.RenderUpdates):
+    """
+    弾の位置，1フレームの移動量，大きさをNumPy配列で持つスプライトグループ（NumPyが必要）
+    update()では各弾のupdate()を呼ばず，全弾の移動・画面外判定・配列の詰め直しを一度に行う
+    描画と衝突判定も配列から直接行い，各弾のrectは読まれるとき（sprites()や衝突時）にだけ書き戻す
+    弾はmove属性（frame_moveの戻り値）を持ち，グループに入れた後はrectとimageを外から変えないこと
+    """
+    def __init__(self, *sprites: pg.sprite.Sprite):
+        if np is None:
+            raise RuntimeError("ProjectileGroupにはNumPyが必要です")
+        self.slots: list[pg.sprite.Sprite | None] = []  # 配列の行に対応するスプライト（削除済みはNone）
+        self.images: list[pg.Surface | None] = []  # 配列の行に対応する画像
+        self.index: dict[pg.sprite.Sprite, int] = {}  # スプライトと配列の行番号の辞書
+        self.pos = np.zeros((16, 2), np.int64)  # 左上座標
+        self.vel = np.zeros((16, 2), np.int64)  # 1フレームの移動量
+        self.size = np.zeros((16, 2), np.int64)  # 幅，高さ
+        self.alive = np.zeros(16, bool)  # 行が削除されていないかどうか
+        self.dead = 0  # 削除済みの行数
+        self.stale = False  # 配列の位置がrectにまだ書き戻されていないかどうか
+        self.drawn: list[pg.Rect] = []  # 前回drawで描画した領域
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite: pg.sprite.Sprite, layer=None):
+        super().add_internal(sprite, layer)
+        if sprite in self.index:
+            return
+        n = len(self.slots)
+        if n == len(self.pos):  # 配列が足りなければ倍に広げる
+            self.pos, self.vel, self.size = (np.resize(a, (2*n, 2)) for a in (self.pos, self.vel, self.size))
+            self.alive = np.resize(self.alive, 2*n)
+        self.pos[n] = sprite.rect.topleft
+        self.alive[n] = True
+        self.vel[n] = getattr(sprite, "move", (0, 0))
+        self.size[n] = sprite.rect.size
+        self.index[sprite] = n
+        self.slots.append(sprite)
+        self.images.append(sprite.image)
+
+    def remove_internal(self, sprite: pg.sprite.Sprite):
+        super().remove_internal(sprite)
+        n = self.index.pop(sprite, None)
+        if n is not None:
+            self.sync_one(sprite, n)
+            self.slots[n] = None
+            self.images[n] = None
+            self.alive[n] = False
+            self.dead += 1
+
+    def sync_one(self, sprite: pg.sprite.Sprite, n: int | None = None):
+        """
+        spriteのrectを配列上の位置に合わせる
+        """
+        sprite.rect.topleft = self.pos[self.index[sprite] if n is None else n].tolist()
+
+    def sync(self):
+        """
+        全弾のrectを配列上の位置に合わせる
+        """
+        if self.stale:
+            for spr, xy in zip(self.slots, self.pos.tolist()):
+                if spr is not None:
+                    spr.rect.topleft = xy
+            self.stale = False
+
+    def sprites(self) -> list[pg.sprite.Sprite]:
+        self.sync()
+        return super().sprites()
+
+    def compact(self):
+        """
+        削除済みの行を取り除いて配列を詰め直す
+        """
+        n = len(self.slots)
+        keep = self.alive[:n].copy()
+        m = int(keep.sum())
+        for a in (self.pos, self.vel, self.size):
+            a[:m] = a[:n][keep]
+        self.alive[:m] = True
+        self.alive[m:n] = False
+        mask = keep.tolist()
+        self.slots = list(itertools.compress(self.slots, mask))
+        self.images = list(itertools.compress(self.images, mask))
+        self.index = dict(zip(self.slots, range(m)))
+        self.dead = 0
+
+    def update(self):
+        """
+        全弾を1フレーム分移動させ，画面外に出た弾をkillする
+        削除済みの行が全体の1/4を超えたら配列を詰め直す
+        """
+        if 4*self.dead > len(self.slots):
+            self.compact()
+        n = len(self.slots)
+        if n == 0:
+            return
+        pos = self.pos[:n]
+        pos += self.vel[:n]
+        self.stale = True
+        end = pos+self.size[:n]  # 右下座標
+        out = (pos[:, 0] < 0) | (WIDTH < end[:, 0]) | (pos[:, 1] < 0) | (HEIGHT < end[:, 1])
+        for i in np.flatnonzero(out & self.alive[:n]).tolist():
+            self.slots[i].kill()
+
+    def draw(self, surface: pg.Surface, alpha: float = 1.0) -> list[pg.Rect]:
+        """
+        全弾を一度のblitsで描画し，前回と今回の描画領域のリストを返す
+        引数1 surface：描画先Surface
+        引数2 alpha：直前の1ステップのうち描画する時点の割合（1.0なら現在位置，補間描画用）
+        """
+        n = len(self.slots)
+        pos = self.pos[:n]
+        if alpha < 1.0:  # 弾は1ステップにvelだけ進むので，戻す量も配列で計算できる
+            pos = pos-np.rint(self.vel[:n]*(1.0-alpha)).astype(np.int64)
+        blits = zip(self.images, pos.tolist())
+        if self.dead:
+            blits = itertools.compress(blits, self.alive[:n].tolist())
+        rects = surface.blits(blits)
+        dirty = self.drawn+rects
+        self.drawn = rects
+        return dirty
+
+    def clear(self, surface: pg.Surface, bgd: pg.Surface):
+        """
+        前回drawで描画した領域をbgdで塗り直す
+        """
+        for rect in self.drawn:
+            surface.blit(bgd, rect, rect)
+
+    def overlaps(self, rect: pg.Rect) -> "np.ndarray":
+        """
+        rectと重なる行の真理値配列を返す（pg.Rect.colliderectと同じ判定）
+        """
+        n = len(self.slots)
+        pos, end = self.pos[:n], self.pos[:n]+self.size[:n]
+        if rect.width == 0 or rect.height == 0:
+            return np.zeros(n, bool)
+        return ((pos[:, 0] < rect.right) & (rect.left < end[:, 0]) & (pos[:, 1] < rect.bottom) & (rect.top < end[:, 1])
+                & (self.size[:n, 0] > 0) & (self.size[:n, 1] > 0) & self.alive[:n])
+
+    def collide_rect(self, rect: pg.Rect, dokill: bool) -> list[pg.sprite.Sprite]:
+        """
+        rectと重なる弾のリストをグループ内の並び順で返す（pg.sprite.spritecollideと同じ挙動）
+        引数1 rect：判定する領域
+        引数2 dokill：重なった弾をkillするかどうか
+        """
+        crashed = [self.slots[i] for i in np.flatnonzero(self.overlaps(rect)).tolist()]
+        crashed = [spr for spr in crashed if spr is not None]
+        for spr in crashed:
+            self.sync_one(spr)
+            if dokill:
+                spr.kill()
+        return crashed
+
+    def groupcollide(self, other: "ProjectileGroup", dokilla: bool, dokillb: bool,
+                     chunk: int = 1024) -> dict[pg.sprite.Sprite, list[pg.sprite.Sprite]]:
+        """
+        pg.sprite.groupcollideと同じ結果を，全組の重なりを配列で一度に計算して返す
+        引数1 other：相手側の弾のグループ
+        引数2 dokilla：衝突した自分側の弾をkillするかどうか
+        引数3 dokillb：衝突した相手側の弾をkillするかどうか
+        引数4 chunk：一度に計算する自分側の行数
+        """
+        crashed = {}
+        if self.dead:
+            self.compact()
+        if other.dead:
+            other.compact()
+        n, m = len(self.slots), len(other.slots)
+        if n == 0 or m == 0:
+            return crashed
+        a0, b0 = self.pos[:n], other.pos[:m]
+        a1, b1 = a0+self.size[:n], b0+other.size[:m]
+        b_ok = (other.size[:m, 0] > 0) & (other.size[:m, 1] > 0) & other.alive[:m]
+        for start in range(0, n, chunk):
+            a0c, a1c = a0[start:start+chunk, None], a1[start:start+chunk, None]
+            hit = ((a0c[..., 0] < b1[:, 0]) & (b0[:, 0] < a1c[..., 0])
+                   & (a0c[..., 1] < b1[:, 1]) & (b0[:, 1] < a1c[..., 1]) & b_ok)
+            for r in np.flatnonzero(hit.any(axis=1)).tolist():
+                spr = self.slots[start+r]
+                if spr is None or 0 in spr.rect.size:
+                    continue
+                collision = [other.slots[j] for j in np.flatnonzero(hit[r]).tolist()]
+                collision = [o for o in collision if o is not None]
+                if not collision:
+                    continue
+                self.sync_one(spr)
+                for o in collision:
+                    other.sync_one(o)
+                    if dokillb:
+                        o.kill()
+                crashed[spr] = collision
+                if dokilla:
+                    spr.kill()
+        return crashed
+
+
+class Pool:
+    """
+    killされたスプライトを取っておき，次に必要になったときreset()で初期化し直して再利用するクラス
+    """
+    def __init__(self, cls: type, cap: int = 512):
+        """
+        引数1 cls：プールするスプライトのクラス（Pooledを継承し，reset()を持つ）
+        引数2 cap：取っておくスプライトの上限数
+        """
+        self.cls = cls
+        self.cap = cap
+        self.free: list[pg.sprite.Sprite] = []  # 再利用を待つスプライト
+        self.hits = 0  # 再利用した回数
+        self.misses = 0  # 新しく生成した回数
+        self.live = 0  # プールから出て使われている数
+        self.high = 0  # liveの最大値
+
+    def acquire(self, *args) -> pg.sprite.Sprite:
+        """
+        取っておいたスプライトをargsで初期化し直して返す．なければ新しく生成する
+        引数 args：clsのreset()（__init__()）に渡す引数
+        """
+        if self.free:
+            obj = self.free.pop()
+            obj.reset(*args)
+            self.hits += 1
+        else:
+            obj = self.cls(*args)
+            self.misses += 1
+        obj.pool = self
+        self.live += 1
+        self.high = max(self.high, self.live)
+        return obj
+
+    def release(self, obj: pg.sprite.Sprite):
+        """
+        killされたobjを受け取り，上限までは再利用のために取っておく
+        """
+        self.live -= 1
+        if len(self.free) < self.cap:
+            self.free.append(obj)
+
+    def stats(self) -> dict[str, int]:
+        """
+        再利用数，生成数，使用中の数とその最大値，待機中の数を辞書で返す
+        """
+        return {"hits": self.hits, "misses": self.misses, "live": self.live, "high": self.high, "free": len(self.free)}
+
+
+class Pooled:
+    """
+    Poolから取り出して使うスプライトのクラスに継承させるクラス
+    killされると取り出し元のプールに戻る．インスタンスはacquire()で作る
+    """
+    pool: Pool | None = None  # 取り出し元のプール（プール外で生成したものはNone）
+
+    @classmethod
+    def acquire(cls, *args) -> "Pooled":
+        """
+        clsのプールからインスタンスを取り出す（引数は__init__と同じ）
+        """
+        return POOLS[cls].acquire(*args)
+
+    def kill(self):
+        super().kill()
+        pool, self.pool = self.pool, None
+        if pool is not None:  # 二重にkillされても一度だけ戻す
+            pool.release(self)
+
+
 class Plane(pg.sprite.Sprite):
     """
     ゲームキャラクターに関するクラス
@@ -56,17 +622,16 @@ class Plane(pg.sprite.Sprite):
         引数2 xy：飛行機画像の位置座標タプル
         """
         super().__init__()
-        img0 = pg.transform.rotozoom(pg.image.load(f"ex05/fig/w.png"), 0, 0.2)
-        img = pg.transform.flip(img0, True, False)  # デフォルトの飛行機
-        self.imgs = {
-            (+1, 0): img,  # 右
-            (+1, -1): pg.transform.rotozoom(img, 45, 1.0),  # 右上
-            (0, -1): pg.transform.rotozoom(img, 90, 1.0),  # 上
-            (-1, -1): pg.transform.rotozoom(img0, -45, 1.0),  # 左上
-            (-1, 0): img0,  # 左
-            (-1, +1): pg.transform.rotozoom(img0, 45, 1.0),  # 左下
-            (0, +1): pg.transform.rotozoom(img, -90, 1.0),  # 下
-            (+1, +1): pg.transform.rotozoom(img, -45, 1.0),  # 右下
+        path = "fig/w.png"
+        self.imgs = {  # 8方向の画像は初回生成時にキャッシュされ，以降は使い回す
+            (+1, 0): ASSETS.variant(path, 0, 0.2, True),  # 右（デフォルトの飛行機）
+            (+1, -1): ASSETS.variant(path, 45, 0.2, True),  # 右上
+            (0, -1): ASSETS.variant(path, 90, 0.2, True),  # 上
+            (-1, -1): ASSETS.variant(path, -45, 0.2),  # 左上
+            (-1, 0): ASSETS.variant(path, 0, 0.2),  # 左
+            (-1, +1): ASSETS.variant(path, 45, 0.2),  # 左下
+            (0, +1): ASSETS.variant(path, -90, 0.2, True),  # 下
+            (+1, +1): ASSETS.variant(path, -45, 0.2, True),  # 右下
         }
         self.dire = (+1, 0)
         self.image = self.imgs[self.dire]
@@ -84,15 +649,15 @@ class Plane(pg.sprite.Sprite):
         引数1 num：飛行機画像ファイル名の番号
         引数2 screen：画面Surface
         """
-        self.image = pg.transform.rotozoom(pg.image.load(f"ex05/fig/w.png"), 0, 0.2)
+        self.image = ASSETS.variant("fig/w.png", 0, 0.2)
         screen.blit(self.image, self.rect)
 
     
-    def update(self, key_lst: list[bool], screen: pg.Surface):
+    def update(self, key_lst: list[bool]):
         """
         押下キーに応じて飛行機を移動させる
-        引数1 key_lst：押下キーの真理値リスト
-        引数2 screen：画面Surface
+        描画は飛行機を入れたスプライトグループのdrawで行う
+        引数 key_lst：押下キーの真理値リスト
         """
         sum_mv = [0, 0]
         for k, mv in __class__.delta.items():
@@ -109,11 +674,9 @@ class Plane(pg.sprite.Sprite):
             self.image = self.imgs[self.dire]
         if self.state == "hyper":
             self.hyper_life -= 1
-            self.image = pg.transform.rotozoom(pg.image.load("ex05/fig/barrier.png"), 0, 0.4)
+            self.image = ASSETS.variant("fig/barrier.png", 0, 0.4)
         if self.state == "hyper" and self.hyper_life <0:
             self.change_state("normal", -1)
-         
-        screen.blit(self.image, self.rect)
     
     
     def get_direction(self) -> tuple[int, int]:
@@ -124,96 +687,182 @@ class Plane(pg.sprite.Sprite):
         self.state = state
         self.hyper_life = hyper_life
 
-class Bomb(pg.sprite.Sprite):
+class Bomb(Pooled, pg.sprite.Sprite):
     """
     爆弾に関するクラス
     """
     colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (255, 0, 255), (0, 255, 255)]
 
-    def __init__(self, emy: "Enemy", plane: Plane):
+    def __init__(self, emy: "Enemy", plane: Plane, rng=random):
+        super().__init__()
+        self.reset(emy, plane, rng)
+
+    def reset(self, emy: "Enemy", plane: Plane, rng=random):
         """
         爆弾円Surfaceを生成する
         引数1 emy：爆弾を投下する敵機
         引数2 plane：攻撃対象の飛行機
+        引数3 rng：乱数生成器（random.Randomまたはrandomモジュール）
         """
-        super().__init__()
-        rad = random.randint(10, 50)  # 爆弾円の半径：10以上50以下の乱数
-        color = random.choice(__class__.colors)  # 爆弾円の色：クラス変数からランダム選択
-        self.image = pg.Surface((2*rad, 2*rad))
-        pg.draw.circle(self.image, color, (rad, rad), rad)
-        self.image.set_colorkey((0, 0, 0))
+        rad = rng.randint(10, 50)  # 爆弾円の半径：10以上50以下の乱数
+        color = rng.choice(__class__.colors)  # 爆弾円の色：クラス変数からランダム選択
+        self.image = ASSETS.circle("bomb", rad, color)
         self.rect = self.image.get_rect()
         # 爆弾を投下するemyから見た攻撃対象のplaneの方向を計算
         self.vx, self.vy = calc_orientation(emy.rect, plane.rect)  
         self.rect.centerx = emy.rect.centerx
         self.rect.centery = emy.rect.centery+emy.rect.height/2
         self.speed = 6
+        self.move = frame_move((+self.speed*self.vx, +self.speed*self.vy))  # 1フレームの移動量
 
     def update(self):
         """
         爆弾を速度ベクトルself.vx, self.vyに基づき移動させる
         引数 screen：画面Surface
         """
-        self.rect.move_ip(+self.speed*self.vx, +self.speed*self.vy)
+        self.rect.move_ip(self.move)
         if check_bound(self.rect) != (True, True):
             self.kill()
 
 
-class BossBomb(pg.sprite.Sprite):
+class BossBomb(Pooled, pg.sprite.Sprite):
     """
     ボスの爆弾に関するクラス
     """
     colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (255, 0, 255), (0, 255, 255)]
 
-    def __init__(self, boss: "Boss", plane: Plane):
+    def __init__(self, boss: "Boss", plane: Plane, rng=random, direction: tuple[float, float] | None = None):
+        super().__init__()
+        self.reset(boss, plane, rng, direction)
+
+    def reset(self, boss: "Boss", plane: Plane, rng=random, direction: tuple[float, float] | None = None):
         """
         爆弾円Surfaceを生成する
         引数1 boss：爆弾を投下する敵機
         引数2 plane：攻撃対象の飛行機
+        引数3 rng：乱数生成器（random.Randomまたはrandomモジュール）
+        引数4 direction：進む方向の単位ベクトル（省略時はplaneに向かう）
         """
-        super().__init__()
-        rad = random.randint(50, 80)  # 爆弾円の半径：80以上100以下の乱数
-        color = random.choice(__class__.colors)  # 爆弾円の色：クラス変数からランダム選択
-        self.image = pg.Surface((2.5*rad, 2.5*rad))
-        pg.draw.circle(self.image, color, (rad, rad), rad)
-        self.image.set_colorkey((0, 0, 0))
+        rad = rng.randint(50, 80)  # 爆弾円の半径：80以上100以下の乱数
+        color = rng.choice(__class__.colors)  # 爆弾円の色：クラス変数からランダム選択
+        self.image = ASSETS.circle("boss", rad, color)  # 円がちょうど収まる2*rad四方の画像
         self.rect = self.image.get_rect()
         # 爆弾を投下するemyから見た攻撃対象のplaneの方向を計算
-        self.vx, self.vy = calc_orientation(boss.rect, plane.rect)  
+        self.vx, self.vy = direction or calc_orientation(boss.rect, plane.rect)
         self.rect.centerx = boss.rect.centerx
         self.rect.centery = boss.rect.centery+boss.rect.height/2
         self.speed = 9
+        self.move = frame_move((+self.speed*self.vx, +self.speed*self.vy))  # 1フレームの移動量
 
     def update(self):
         """
         爆弾を速度ベクトルself.vx, self.vyに基づき移動させる
         引数 screen：画面Surface
         """
-        self.rect.move_ip(+self.speed*self.vx, +self.speed*self.vy)
+        self.rect.move_ip(self.move)
         if check_bound(self.rect) != (True, True):
             self.kill()
 
 
-class Beam(pg.sprite.Sprite):
+class BossPattern:
+    """
+    ボスの弾幕（自機狙い，扇形，全方位，渦巻き）を1回の呼び出しでまとめて発射するクラス
+    方向は1度刻みの単位ベクトル表から引くので，弾ごとに三角関数を計算しない
+    1ステップに出す弾数の上限budgetと，画面上のボスの弾の上限capを超える分は発射しない
+    """
+    DIRS = [(math.cos(math.radians(a)), math.sin(math.radians(a))) for a in range(360)]  # 角度（度，画面座標）ごとの単位ベクトル
+    # 順に繰り返す(パターン, 弾数, 次の発射までのステップ数)
+    PROGRAM = (
+        ("aimed", 1, 5), ("aimed", 1, 5), ("aimed", 1, 5), ("fan", 5, 20), ("ring", 12, 25),
+        ("spiral", 4, 5), ("spiral", 4, 5), ("spiral", 4, 5), ("spiral", 4, 5), ("spiral", 4, 20),
+    )
+
+    def __init__(self, budget: int = 24, cap: int = 120, program: tuple = PROGRAM,
+                 spread: int = 12, turn: int = 11):
+        """
+        引数1 budget：1ステップに発射する弾数の上限
+        引数2 cap：画面上のボスの弾数の上限
+        引数3 program：順に繰り返す(パターン, 弾数, 次の発射までのステップ数)の並び
+        引数4 spread：扇形の弾の間隔（度）
+        引数5 turn：渦巻きが1回ごとに回る角度（度）
+        """
+        self.budget = budget
+        self.cap = cap
+        self.program = program
+        self.spread = spread
+        self.turn = turn
+        self.pos = 0  # 次に使うprogramの位置
+        self.phase = 0  # 渦巻きの向き（度）
+        self.tick = -1  # 発射数を数えているステップ
+        self.spent = 0  # そのステップに発射した弾数
+
+    def angles(self, kind: str, count: int, boss: "Boss", plane: Plane) -> list[int]:
+        """
+        パターンkindでcount発撃つときの各弾の角度（DIRSの添字）を返す
+        """
+        if kind == "ring":
+            return [i*360//count for i in range(count)]
+        if kind == "spiral":
+            self.phase = (self.phase+self.turn)%360
+            return [(self.phase+i*360//count)%360 for i in range(count)]
+        aim = round(math.degrees(math.atan2(plane.rect.centery-boss.rect.centery,
+                                            plane.rect.centerx-boss.rect.centerx)))
+        if kind == "fan":
+            return [(aim+round((i-(count-1)/2)*self.spread))%360 for i in range(count)]
+        return [aim%360]*count  # aimed
+
+    def fire(self, boss: "Boss", plane: Plane, group: pg.sprite.AbstractGroup, rng, tick: int) -> int:
+        """
+        programの次の弾幕をgroupに追加する
+        引数1 boss：弾を撃つボス
+        引数2 plane：攻撃対象の飛行機
+        引数3 group：弾を追加するグループ
+        引数4 rng：乱数生成器
+        引数5 tick：現在のステップ
+        戻り値：次の発射までのステップ数
+        """
+        kind, count, every = self.program[self.pos]
+        self.pos = (self.pos+1)%len(self.program)
+        if tick != self.tick:
+            self.tick, self.spent = tick, 0
+        angles = self.angles(kind, count, boss, plane)
+        count = min(count, self.budget-self.spent, self.cap-len(group))
+        if count > 0:
+            dirs = self.DIRS
+            group.add(*[BossBomb.acquire(boss, plane, rng, dirs[a]) for a in angles[:count]])
+            self.spent += count
+        return every
+
+
+class Beam(Pooled, pg.sprite.Sprite):
     """
     ビームに関するクラス
     """
     def __init__(self, plane: Plane, score: int):
+        super().__init__()
+        self.reset(plane, score)
+
+    def reset(self, plane: Plane, score: int):
         """
         ビーム画像Surfaceを生成する
         引数 plane：ビームを放つ飛行機
         """
-        super().__init__()
         self.score = score
         self.vx, self.vy = plane.get_direction()
         self.angle = math.degrees(math.atan2(-self.vy, self.vx))
-        self.image = pg.transform.rotozoom(pg.image.load(f"ex04/fig/beam.png"), self.angle, 1.0)
+        self.image = ASSETS.variant("fig/beam.png", self.angle, 1.0)
         self.vx = math.cos(math.radians(self.angle))
         self.vy = -math.sin(math.radians(self.angle))
         self.rect = self.image.get_rect()
         self.rect.centery = plane.rect.centery+plane.rect.height*self.vy
         self.rect.centerx = plane.rect.centerx+plane.rect.width*self.vx
         self.speed = 10
+        moves = []
+        if self.score < 100:
+            moves.append((+self.speed*self.vx, +self.speed*self.vy))
+        if 50 <= self.score:
+            moves.append((+self.speed*self.vx*2, +self.speed*self.vy*2))  #弾速の向上
+        self.move = frame_move(*moves)  # 1フレームの移動量（スコアは発射時に決まるので一度だけ計算）
 
 
     def update(self):
@@ -221,192 +870,233 @@ class Beam(pg.sprite.Sprite):
         ビームを速度ベクトルself.vx, self.vyに基づき移動させる
         引数 screen：画面Surface
         """
-        if self.score < 100:
-            self.rect.move_ip(+self.speed*self.vx, +self.speed*self.vy)
-        if 50 <= self.score:
-            self.rect.move_ip(+self.speed*self.vx*2, +self.speed*self.vy*2)  #弾速の向上
-        elif 100 <= self.score:
-            self.image = pg.transform.rotozoom(pg.image.load(f"ex04/fig/beam.png"), self.angle, 1.5)  #弾のサイズを変更
-            self.rect.move_ip(+self.speed*self.vx*2, +self.speed*self.vy*2)  #弾速の向上
+        self.rect.move_ip(self.move)
             
         if check_bound(self.rect) != (True, True):
             self.kill()
 
 
-class Beam_up(pg.sprite.Sprite):
+class Beam_up(Pooled, pg.sprite.Sprite):
     """
     上方向に向かうビームに関するクラス
     """
     def __init__(self, plane: Plane, score: int):
+        super().__init__()
+        self.reset(plane, score)
+
+    def reset(self, plane: Plane, score: int):
         """
         ビーム画像Surfaceを生成する
         引数 plane：ビームを放つ飛行機
         """
-        super().__init__()
         self.score = score
         self.vx, self.vy = plane.get_direction()
         self.angle = math.degrees(math.atan2(-self.vy, self.vx))
-        self.image = pg.transform.rotozoom(pg.image.load(f"ex04/fig/beam.png"), self.angle, 1.0)
+        self.image = ASSETS.variant("fig/beam.png", self.angle, 1.0)
         self.vx = math.cos(math.radians(self.angle))
         self.vy = -math.sin(math.radians(self.angle))
         self.rect = self.image.get_rect()
         self.rect.centery = plane.rect.centery+plane.rect.height*self.vy
         self.rect.centerx = plane.rect.centerx+plane.rect.width*self.vx
         self.speed = 10
+        self.move = frame_move((+self.speed*self.vx+1, +self.speed*self.vy+1))  # 1フレームの移動量
 
     def update(self):
         """
         ビームを速度ベクトルself.vx+1, self.vy+1に基づき移動させる
         引数 screen：画面Surface
         """
-        self.rect.move_ip(+self.speed*self.vx+1, +self.speed*self.vy+1)
+        self.rect.move_ip(self.move)
             
         if check_bound(self.rect) != (True, True):
             self.kill()
 
 
-class Beam_down(pg.sprite.Sprite):
+class Beam_down(Pooled, pg.sprite.Sprite):
     """
     下方向に向かうビームに関するクラス
     """
     def __init__(self, plane: Plane, score: int):
+        super().__init__()
+        self.reset(plane, score)
+
+    def reset(self, plane: Plane, score: int):
         """
         ビーム画像Surfaceを生成する
         引数 plane：ビームを放つ飛行機
         """
-        super().__init__()
         self.score = score
         self.vx, self.vy = plane.get_direction()
         self.angle = math.degrees(math.atan2(-self.vy, self.vx))
-        self.image = pg.transform.rotozoom(pg.image.load(f"ex04/fig/beam.png"), self.angle, 1.0)
+        self.image = ASSETS.variant("fig/beam.png", self.angle, 1.0)
         self.vx = math.cos(math.radians(self.angle))
         self.vy = -math.sin(math.radians(self.angle))
         self.rect = self.image.get_rect()
         self.rect.centery = plane.rect.centery+plane.rect.height*self.vy
         self.rect.centerx = plane.rect.centerx+plane.rect.width*self.vx
         self.speed = 10
+        self.move = frame_move((+self.speed*self.vx-1, +self.speed*self.vy-1))  # 1フレームの移動量
 
     def update(self):
         """
         ビームを速度ベクトルself.vx-1, self.vy+-1に基づき移動させる
         引数 screen：画面Surface
         """
-        self.rect.move_ip(+self.speed*self.vx-1, +self.speed*self.vy-1)
+        self.rect.move_ip(self.move)
             
         if check_bound(self.rect) != (True, True):
             self.kill()
 
 
-class Explosion(pg.sprite.Sprite):
+class Explosion(Pooled, pg.sprite.Sprite):
     """
     爆発に関するクラス
+    フレーム画像は全インスタンスで共有のAnimationを使い，各インスタンスは経過ステップ数と寿命だけを持つ
     """
+    __slots__ = ("anim", "t", "life")
+
     def __init__(self, obj: "Bomb|Boss", life: int):
+        super().__init__()
+        self.reset(obj, life)
+
+    def reset(self, obj: "Bomb|Boss", life: int):
         """
         爆弾が爆発するエフェクトを生成する
         引数1 obj：爆発するBombまたは敵機インスタンス
-        引数2 life：爆発時間
+        引数2 life：爆発時間（ステップ）
         """
-        super().__init__()
-        img = pg.image.load("ex05/fig/explosion.gif")
-        self.imgs = [img, pg.transform.flip(img, 1, 1)]
-        self.image = self.imgs[0]
+        self.anim = ASSETS.animation("fig/explosion.gif")
+        self.image = self.anim.frames[0]
         self.rect = self.image.get_rect(center=obj.rect.center)
+        self.t = 0
         self.life = life
 
-
     def update(self):
         """
-        爆発時間を1減算した爆発経過時間_lifeに応じて爆発画像を切り替えることで
-        爆発エフェクトを表現する
+        経過ステップ数を1増やし，経過時間に応じた爆発画像に切り替えることで
+        爆発エフェクトを表現する．爆発時間を過ぎたら消える
         """
-        self.life -= 1
-        self.image = self.imgs[self.life//10%2]
-        if self.life < 0:
+        self.t += 1
+        self.image = self.anim.frame(self.t*TICK)
+        if self.t > self.life:
             self.kill()
 
 
-class Enemy(pg.sprite.Sprite):
+DOWN, STOP = 0, 1  # 敵機の状態（降下中，停止中）
+
+
+class EnemyBase(pg.sprite.Sprite):
     """
-    敵機に関するクラス
+    画面上端から停止位置まで降下し，停止したら爆弾を投下する敵の共通クラス
+    種類ごとの違いはクラス属性（画像，出現位置と停止位置の範囲）で与える
+    pg.sprite.Spriteは__dict__を持つので，毎フレーム読む値だけを__slots__に置く
     """
-    imgs = [pg.image.load(f"ex05/fig/alien{i}.png") for i in range(1, 4)]
-    def __init__(self):
+    __slots__ = ("vy", "bound", "state", "interval")
+    imgs: str | list[str] = ""  # 画像のパス（リストなら出現ごとにランダムに選ぶ）．set_mode後に読み込むのでパスだけ持つ
+    xs = (0, WIDTH)  # 出現位置のx座標の範囲
+    bounds = (50, HEIGHT//2)  # 停止位置の範囲
+    fire_every = 0  # 爆弾投下の間隔（0なら出現ごとにランダムに決めたinterval）
+
+    def __init__(self, rng=random):
+        """
+        引数 rng：乱数生成器（random.Randomまたはrandomモジュール）
+        """
         super().__init__()
-        self.image = random.choice(__class__.imgs)
+        imgs = self.imgs
+        self.image = ASSETS.load(imgs if isinstance(imgs, str) else rng.choice(imgs))
         self.rect = self.image.get_rect()
-        self.rect.center = random.randint(0, WIDTH), 0
+        self.rect.center = rng.randint(*self.xs), 0
         self.vy = +6
-        self.bound = random.randint(50, HEIGHT/2)  # 停止位置
-        self.state = "down"  # 降下状態or停止状態
-        self.interval = random.randint(50, 300)  # 爆弾投下インターバル
-
+        self.bound = rng.randint(*self.bounds)  # 停止位置
+        self.state = DOWN  # 降下状態or停止状態
+        self.interval = rng.randint(50, 300)  # 爆弾投下インターバル
 
     def update(self):
         """
         敵機を速度ベクトルself.vyに基づき移動（降下）させる
-        ランダムに決めた停止位置_boundまで降下したら，_stateを停止状態に変更する
-        引数 screen：画面Surface
+        ランダムに決めた停止位置boundまで降下したら，stateを停止状態に変更する
         """
+        if self.state == STOP:
+            return
         if self.rect.centery > self.bound:
             self.vy = 0
-            self.state = "stop"
+            self.state = STOP
+            return
         self.rect.centery += self.vy
 
 
-class Enemy2(pg.sprite.Sprite):
+class Enemy(EnemyBase):
     """
     敵機に関するクラス
     """
-    imgs = pg.transform.rotozoom(pg.image.load(f"ex05/fig/kohacu.png"),0, 1)
-    
-    def __init__(self):
-        super().__init__()
-        self.image = (__class__.imgs)
-        self.rect = self.image.get_rect()
-        self.rect.center = random.randint(0, WIDTH), 0
-        self.vy = +6
-        self.bound = random.randint(50, HEIGHT)  # 停止位置
-        self.state = "down"  # 降下状態or停止状態
-        self.interval = random.randint(50, 300)  # 爆弾投下インターバル
+    __slots__ = ()
+    imgs = [f"fig/alien{i}.png" for i in range(1, 4)]
 
-    def update(self):
-        """
-        敵機を速度ベクトルself.vyに基づき移動（降下）させる
-        ランダムに決めた停止位置_boundまで降下したら，_stateを停止状態に変更する
-        引数 screen：画面Surface
-        """
-        if self.rect.centery > self.bound:
-            self.vy = 0
-            self.state = "stop"
-        self.rect.centery += self.vy
 
-class Boss(pg.sprite.Sprite):
+class Enemy2(EnemyBase):
+    """
+    敵機に関するクラス（Enemyを10体倒すと出現し，画面の下の方まで降りてくる）
+    """
+    __slots__ = ()
+    imgs = "fig/kohacu.png"
+    bounds = (50, HEIGHT)
+
+
+class Boss(EnemyBase):
     """
     ボスに関するクラス
     """
-    imgs = [pg.image.load("ex05/fig/shinigami.png")]
-    
-    def __init__(self):
-        super().__init__()
-        self.image = random.choice(__class__.imgs)
-        self.rect = self.image.get_rect()
-        self.rect.center = random.randint(1000, WIDTH), 0
-        self.vy = +6
-        self.bound = random.randint(50, HEIGHT/2)  # 停止位置
-        self.state = "down"  # 降下状態or停止状態
-        self.interval = random.randint(50, 300)  # 爆弾投下インターバル
+    __slots__ = ()
+    imgs = ["fig/shinigami.png"]
+    xs = (1000, WIDTH)
+    fire_every = 5
 
-    def update(self):
+
+class Digits:
+    """
+    数字のグリフを一度だけ描画しておき，ラベル付きの数値画像を組み立てるクラス
+    """
+    atlases: dict[tuple, "Digits"] = {}  # (フォントサイズ, 色)ごとに共有するグリフ集
+
+    def __init__(self, size: int, color: tuple[int, int, int]):
         """
-        bossを速度ベクトルself.vyに基づき移動（降下）させる
-        ランダムに決めた停止位置_boundまで降下したら，_stateを停止状態に変更する
-        引数 screen：画面Surface
+        0～9と-のグリフを描画する
+        引数1 size：フォントサイズ
+        引数2 color：文字色
         """
-        if self.rect.centery > self.bound:
-            self.vy = 0
-            self.state = "stop"
-        self.rect.centery += self.vy
+        self.font = pg.font.Font(None, size)
+        self.color = color
+        self.glyphs = {c: self.font.render(c, 0, color) for c in "0123456789-"}
+
+    @classmethod
+    def get(cls, size: int, color: tuple[int, int, int]) -> "Digits":
+        """
+        sizeとcolorに対応するグリフ集を返す．初回のみグリフを描画する
+        """
+        key = (size, color)
+        if key not in cls.atlases:
+            cls.atlases[key] = cls(size, color)
+        return cls.atlases[key]
+
+    def render(self, label: str, value: int) -> pg.Surface:
+        """
+        ラベルの後ろに数値を並べた画像を返す
+        ラベルはフォントで描画してキャッシュし，数値はグリフを並べて作る
+        引数1 label：数値の前に表示する文字列
+        引数2 value：表示する数値
+        戻り値：カラーキー（黒）付きの画像Surface
+        """
+        head = self.glyphs.get(label)
+        if head is None:
+            head = self.glyphs[label] = self.font.render(label, 0, self.color)
+        parts = [head] + [self.glyphs[c] for c in str(value)]
+        img = pg.Surface((sum(p.get_width() for p in parts), max(p.get_height() for p in parts)))
+        x = 0
+        for part in parts:
+            img.blit(part, (x, 0))
+            x += part.get_width()
+        img.set_colorkey((0, 0, 0), pg.RLEACCEL)
+        return Assets.prepare(img)
 
 
 class Boss_hp(): 
@@ -414,19 +1104,22 @@ class Boss_hp():
     ボスのヒットポイントに関するクラス
     """
     def __init__(self):
-        self.font = pg.font.Font(None, 50)
         self.color = (0, 0, 255)
+        self.digits = Digits.get(50, self.color)
         self.boss_hp = 50
-        self.image = self.font.render(f"Boss_hp: {self.boss_hp}", 0, self.color)
+        self.image = self.digits.render("Boss_hp: ", self.boss_hp)
+        self.shown = self.boss_hp  # 画像に描画済みのヒットポイント
         self.rect = self.image.get_rect()
         self.rect.center = 1000, HEIGHT-50 
     
     def hp_down(self,down):
         self.boss_hp -= down
 
-    def update(self, screen: pg.Surface):
-        self.image = self.font.render(f"Boss_hp: {self.boss_hp}", 0, self.color)
-        screen.blit(self.image, self.rect)
+    def update(self, screen: pg.Surface) -> pg.Rect:
+        if self.boss_hp != self.shown:  # 値が変わったときだけ画像を作り直す
+            self.image = self.digits.render("Boss_hp: ", self.boss_hp)
+            self.shown = self.boss_hp
+        return screen.blit(self.image, self.rect)
 
 
 
@@ -438,10 +1131,11 @@ class Zanki:
     """
 
     def __init__(self):
-        self.font = pg.font.Font(None, 50)
         self.color = (255, 255, 255)
+        self.digits = Digits.get(50, self.color)
         self.zanki = 3
-        self.zimage = self.font.render(f"HP: {self.zanki}", 0, self.color)
+        self.zimage = self.digits.render("HP: ", self.zanki)
+        self.shown = self.zanki  # 画像に描画済みの残機
         self.rect  =self.zimage.get_rect()
         self.rect.center = 100, HEIGHT-90
 
@@ -454,9 +1148,11 @@ class Zanki:
         self.zanki -= down
 
 
-    def update(self, screen: pg.Surface):
-        self.zimage = self.font.render(f"HP: {self.zanki}", 0 , self.color)
-        screen.blit(self.zimage, self.rect) 
+    def update(self, screen: pg.Surface) -> pg.Rect:
+        if self.zanki != self.shown:  # 値が変わったときだけ画像を作り直す
+            self.zimage = self.digits.render("HP: ", self.zanki)
+            self.shown = self.zanki
+        return screen.blit(self.zimage, self.rect)
 
 
 class gameover:
@@ -470,9 +1166,8 @@ class gameover:
         self.rect = self.image.get_rect()
         self.rect.center = 750,HEIGHT -450
     
-    def update(self, screen: pg.Surface):
-        self.gimage = self.font.render(f"Game Over", 0 , self.color)
-        screen.blit(self.gimage, self.rect)
+    def update(self, screen: pg.Surface) -> pg.Rect:
+        return screen.blit(self.image, self.rect)  # 文字列は変わらないので__init__で描画した画像を使う
 
 class clear: 
     def __init__(self):
@@ -483,9 +1178,8 @@ class clear:
         self.rect.center = 750,HEIGHT -450
     
 
-    def update(self, screen: pg.Surface):
-        self.cimage = self.font.render("Game Clear",0, self.color)
-        screen.blit(self.image, self.rect)
+    def update(self, screen: pg.Surface) -> pg.Rect:
+        return screen.blit(self.image, self.rect)  # 文字列は変わらないので__init__で描画した画像を使う
 
 class Score:
     """
@@ -494,10 +1188,11 @@ class Score:
     敵機：10点
     """
     def __init__(self):
-        self.font = pg.font.Font(None, 50)
         self.color = (255, 255, 255)
+        self.digits = Digits.get(50, self.color)
         self.score = 0
-        self.image = self.font.render(f"Score: {self.score}", 0, self.color)
+        self.image = self.digits.render("Score: ", self.score)
+        self.shown = self.score  # 画像に描画済みのスコア
         self.rect = self.image.get_rect()
         self.rect.center = 100, HEIGHT-50
 
@@ -505,9 +1200,11 @@ class Score:
         self.score += add
     
 
-    def update(self, screen: pg.Surface):
-        self.image = self.font.render(f"Score: {self.score}", 0, self.color)
-        screen.blit(self.image, self.rect)
+    def update(self, screen: pg.Surface) -> pg.Rect:
+        if self.score != self.shown:  # 値が変わったときだけ画像を作り直す
+            self.image = self.digits.render("Score: ", self.score)
+            self.shown = self.score
+        return screen.blit(self.image, self.rect)
 
 
 class Item(pg.sprite.Sprite):
@@ -516,208 +1213,1156 @@ class Item(pg.sprite.Sprite):
     実装済みアイテム：回復薬
     """
     i = 0
-    img_1 = pg.transform.rotozoom(pg.image.load(f"ex05/万能薬.png"), 0, 0.20)
-    img_2 = pg.transform.rotozoom(pg.image.load(f"ex05/毒薬.png"), 0, 0.20)
+    img_1 = "万能薬.png"  # set_mode後に読み込むのでパスだけ持つ
+    img_2 = "毒薬.png"
 
-    def __init__(self):
+    def __init__(self, rng=random):
+        """
+        引数 rng：乱数生成器（random.Randomまたはrandomモジュール）
+        """
         super().__init__()
-        self.i = random.randint(0,9)
+        self.i = rng.randint(0,9)
         if self.i != 0:
-            self.image = __class__.img_1
+            self.image = ASSETS.variant(__class__.img_1, 0, 0.20)
         else:
-            self.image = __class__.img_2
+            self.image = ASSETS.variant(__class__.img_2, 0, 0.20)
         self.rect = self.image.get_rect()
-        self.rect.center = WIDTH, random.randint(0,HEIGHT)
-        self.vx = random.randint(-8, -1)
+        self.rect.center = WIDTH, rng.randint(0,HEIGHT)
+        self.vx = rng.randint(-8, -1)
 
     def update(self):
         self.rect.centerx += self.vx
         if self.rect.left < 0:
             self.kill()
 
-class Effect(pg.sprite.Sprite):
+class Effect(Pooled, pg.sprite.Sprite):
     """
     エフェクトを生成する
+    フレーム画像は回復薬用と毒薬用の共有Animationを使い，各インスタンスは経過ステップ数と寿命だけを持つ
     """
+    __slots__ = ("anim", "t", "life")
+
     def __init__(self, obj: "Item", life: int, num :int):
         super().__init__()
-        if num != 0:
-            img = pg.image.load("ex05/Effect.png")
-        else:
-            img = pg.image.load("ex05/Bad_Effect.png")
-        self.imgs = [img, pg.transform.flip(img, 1, 1)]
-        self.image = self.imgs[0]
+        self.reset(obj, life, num)
+
+    def reset(self, obj: "Item", life: int, num :int):
+        self.anim = ASSETS.animation("Effect.png" if num != 0 else "Bad_Effect.png")
+        self.image = self.anim.frames[0]
         self.rect = self.image.get_rect(center=obj.rect.center)
+        self.t = 0
         self.life = life
 
     def update(self):
-        self.life -= 1
-        self.image = self.imgs[self.life//10%2]
-        if self.life < 0:
+        self.t += 1
+        self.image = self.anim.frame(self.t*TICK)
+        if self.t > self.life:
             self.kill()
 
 
-def main():
-    pg.display.set_caption("宇宙シューティング")
-    screen = pg.display.set_mode((WIDTH, HEIGHT))
-    bg_img = pg.image.load("ex05/fig/Uchu.jpg") #宇宙背景
-    clock  = pg.time.Clock()
-    bg_img2 = pg.transform.flip(bg_img, True, False)
-    score = Score()
-
-    boss_hp = Boss_hp()
-    zanki = Zanki()
-    go = gameover()
-    cl = clear()
-
-    plane = Plane(3, (900, 400))
-    bombs = pg.sprite.Group()
-    beams = pg.sprite.Group()
-    exps = pg.sprite.Group()
-    emys = pg.sprite.Group()
-    bosses = pg.sprite.Group()
-    bossbombs = pg.sprite.Group()
-    emys2 = pg.sprite.Group()
-    enemies_killed = 0 #倒した敵カウンター
-    items = pg.sprite.Group()
-
-    tmr = 0
-    clock = pg.time.Clock()
-    while True:
-        key_lst = pg.key.get_pressed()
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                return 0
-            if event.type == pg.KEYDOWN and event.key == pg.K_SPACE:
-                if score.score < 200:
-                    beams.add(Beam(plane, score.score))
-                elif 200 <= score.score:
-                    beams.add(Beam(plane, score.score))
-                    beams.add(Beam_up(plane, score.score))
-                    beams.add(Beam_down(plane, score.score))
-
-        screen.blit(bg_img, [0, 0])
-
-        if tmr%200 == 0 and bosses is not None:
-            if len(bosses) < 1:  # 200フレームに1回，敵機を出現させる
-                emys.add(Enemy())
-
-        if enemies_killed >= 10 :
-           if tmr%100 == 0:
-            emys2.add(Enemy2()) 
-
-        if  enemies_killed > 30 and bosses is not None:
-                if len(bosses) < 1:
-                    
-                    bosses.add(Boss())
-        if tmr%200 == 0:  # 200フレームに1回，敵機を出現させる
-            emys.add(Enemy())
-        if tmr%200 == 0:  # 200フレームに1回, 回復薬が出現する
-            items.add(Item())
-
-        for emy in emys:
-            if emy.state == "stop" and tmr%emy.interval == 0:
-                # 敵機が停止状態に入ったら，intervalに応じて爆弾投下
-                bombs.add(Bomb(emy, plane))
-        
-        for boss in bosses:
-            if boss.state == "stop" and tmr%5 == 0:
-                bombs.add(BossBomb(boss,plane))
-        
-        for emy2 in emys2:
-            if emy2.state == "stop" and tmr%emy2.interval == 0:
-                bombs.add(Bomb(emy2, plane))
+POOLS = {cls: Pool(cls) for cls in (Beam, Beam_up, Beam_down, Bomb, BossBomb, Explosion, Effect)}  # クラスごとのプール
+
+
+def pool_stats() -> dict[str, dict[str, int]]:
+    """
+    全プールの統計をクラス名ごとの辞書で返す
+    """
+    return {cls.__name__: pool.stats() for cls, pool in POOLS.items()}
 
-        for emy2 in pg.sprite.groupcollide(emys2, beams, True, True).keys():
-            exps.add(Explosion(emy2, 100))  # 爆発エフェクト
+
+class BgScroller:
+    """
+    左右反転画像と交互に並べた背景を横スクロールさせるクラス
+    元画像と反転画像をつないだ帯を最初に一度だけ作り，毎フレーム見えている部分だけを転送する
+    """
+    def __init__(self, img: pg.Surface, speed: float = 1):
+        """
+        引数1 img：背景画像Surface
+        引数2 speed：1フレームあたりのスクロール量（ピクセル）
+        """
+        w, h = img.get_size()
+        strip = pg.Surface((2*w, h))
+        strip.blit(img, (0, 0))
+        strip.blit(pg.transform.flip(img, True, False), (w, 0))
+        self.strip = Assets.prepare(strip)
+        self.period = 2*w  # 背景の模様が一周する長さ
+        self.speed = speed
+
+    def draw(self, surface: pg.Surface, tmr: int):
+        """
+        tmrフレーム目の背景をsurfaceに描画する（見えている切れ目の数だけblitする）
+        引数1 surface：描画先Surface
+        引数2 tmr：フレーム数
+        """
+        x = int(tmr*self.speed)%self.period
+        dx, view_w, h = 0, surface.get_width(), self.strip.get_height()
+        while dx < view_w:
+            w = min(self.period-x, view_w-dx)
+            surface.blit(self.strip, (dx, 0), (x, 0, w, h))
+            dx += w
+            x = 0
+
+
+class Renderer:
+    """
+    背景，スプライトグループ，HUDを画面に描画するクラス
+    dirty=Trueのときは，前フレームから変化した領域だけをディスプレイに送る
+    背景のスクロールは画面全体が変わるため，dirtyモードではscroll_everyフレームごとに
+    まとめて背景を進め，そのフレームだけ画面全体を描き直す
+    dirtyモードではHUDもhud_everyフレームごとにだけ描き直せる（スプライトがHUDに重なったフレームは描き直す）
+    scroll_everyとhud_everyはdirtyモードでだけ効く（通常モードは毎フレーム画面全体を描く）
+    """
+    def __init__(self, screen: pg.Surface, draw_bg, dirty: bool = False, scroll_every: int = 50,
+                 prof: "Profiler | None" = None):
+        """
+        引数1 screen：画面Surface
+        引数2 draw_bg：draw_bg(surface, tmr)で背景を描く関数
+        引数3 dirty：変化した領域だけを更新するかどうか
+        引数4 scroll_every：dirtyモードで背景を進める間隔（フレーム）
+        引数5 prof：描画の各区間を計測するProfiler
+        """
+        self.screen = screen
+        self.prof = prof if prof is not None else Profiler()
+        self.draw_bg = draw_bg
+        self.dirty = dirty
+        self.scroll_every = scroll_every
+        self.hud_every = 1  # dirtyモードでHUDを描き直す間隔（フレーム）
+        self.frames = 0
+        self.background = pg.Surface(screen.get_size()).convert() if dirty else None
+        self.bg_tmr = None  # backgroundに描いてある背景のタイマー値
+        self.hud_rects: list[pg.Rect] = []  # 前フレームでHUDを描いた領域
+        self.alpha = 1.0  # 直前の1ステップのうち描画する時点の割合
+        self.prev: dict[pg.sprite.Sprite, tuple[int, int]] | None = None  # 直前のステップ前の位置
+
+    @staticmethod
+    def snapshot(layers: list) -> dict[pg.sprite.Sprite, tuple[int, int]]:
+        """
+        補間描画のため，ステップを進める前の各スプライトの位置を記録して返す
+        ProjectileGroupの弾は移動量から戻せるので記録しない
+        """
+        return {spr: spr.rect.topleft for layer in layers
+                if isinstance(layer, pg.sprite.AbstractGroup) and not isinstance(layer, ProjectileGroup)
+                for spr in layer.sprites()}
+
+    def draw_layers(self, layers: list, hud: bool = True) -> list[pg.Rect]:
+        """
+        layersを順に描画し，描画した領域のリストを返す
+        alphaが1未満なら，各スプライトをprevの位置と現在位置の間に一時的に動かして描画する
+        引数1 layers：スプライトグループまたはupdate(screen)で自分を描くHUDのリスト
+        引数2 hud：FalseならHUDを描かない（前フレームのものを残す）
+        """
+        moved = []
+        if self.prev is not None and self.alpha < 1.0:
+            a = self.alpha
+            for spr, (x, y) in self.prev.items():
+                rect = spr.rect
+                moved.append((rect, rect.topleft))
+                rect.topleft = round(x+(rect.x-x)*a), round(y+(rect.y-y)*a)
+        rects = []
+        if hud:
+            self.hud_rects = []
+        prof = self.prof
+        for layer in layers:
+            if isinstance(layer, ProjectileGroup):
+                rects += layer.draw(self.screen, self.alpha)
+            elif isinstance(layer, pg.sprite.AbstractGroup):
+                rects += layer.draw(self.screen) or []
+            elif not hud:
+                continue
+            else:
+                rect = layer.update(self.screen)
+                self.hud_rects.append(rect)
+                rects.append(rect)
+            prof.lap(getattr(layer, "name", "hud"), "draw")
+        for rect, xy in moved:
+            rect.topleft = xy
+        return rects
+
+    def render(self, tmr: float, layers: list, alpha: float = 1.0, prev: dict | None = None):
+        """
+        1フレーム分を描画してディスプレイを更新する
+        引数1 tmr：背景のスクロールに使うフレーム数（補間時は小数）
+        引数2 layers：奥から順に並べたスプライトグループとHUDのリスト
+        引数3 alpha：直前の1ステップのうち描画する時点の割合（1.0なら現在の状態をそのまま描く）
+        引数4 prev：snapshot()で記録した直前のステップ前の位置（補間しないならNone）
+        """
+        self.alpha, self.prev = alpha, prev
+        prof = self.prof
+        if not self.dirty:
+            self.draw_bg(self.screen, tmr)
+            prof.lap("bg")
+            self.draw_layers(layers)
+            pg.display.update()
+            prof.lap("display")
+            return
+        bg_tmr = int(tmr) - int(tmr)%self.scroll_every
+        if self.bg_tmr is not None and bg_tmr < self.bg_tmr <= tmr:  # 間隔を広げた直後に背景が戻らないようにする
+            bg_tmr = self.bg_tmr
+        if bg_tmr != self.bg_tmr:  # 背景が動いたときは画面全体を描き直す
+            self.draw_bg(self.background, bg_tmr)
+            self.bg_tmr = bg_tmr
+            self.screen.blit(self.background, (0, 0))
+            prof.lap("bg")
+            self.draw_layers(layers)
+            pg.display.update()
+            prof.lap("display")
+            return
+        self.frames += 1
+        hud = self.frames%self.hud_every == 0
+        dirty_rects = self.erase(layers, hud)
+        prof.lap("bg")
+        rects = self.draw_layers(layers, hud)
+        if not hud and any(rect.collidelist(rects) != -1 for rect in self.hud_rects):
+            # 消したスプライトや描いたスプライトがHUDに重なったら，HUDを含めてこのフレームを描き直す
+            dirty_rects += rects+self.erase(layers, True)
+            rects = self.draw_layers(layers, True)
+        dirty_rects += rects
+        pg.display.update(dirty_rects)
+        prof.lap("display")
+
+    def erase(self, layers: list, hud: bool) -> list[pg.Rect]:
+        """
+        dirtyモードで，前に描いたスプライト（hudがTrueならHUDも）を背景で消し，消したHUDの領域のリストを返す
+        """
+        rects = list(self.hud_rects) if hud else []
+        for rect in rects:  # 前フレームのHUDを背景で消す
+            self.screen.blit(self.background, rect, rect)
+        for layer in layers:  # 前フレームのスプライトを背景で消す
+            if isinstance(layer, pg.sprite.AbstractGroup):
+                layer.clear(self.screen, self.background)
+        return rects
+
+
+class Governor:
+    """
+    フレームの処理時間を予算と比べ，間に合わないときは品質を段階的に下げ，余裕が戻ったら上げるクラス
+    直近windowフレームの平均が予算のdegrade倍を超えたらレベルを1つ上げ（品質を下げ），
+    recover倍未満がholdフレーム続いたら1つ戻す．レベルを変えるたびにloggingで理由を記録する
+    """
+    # レベルごとの設定（0が最高品質）
+    # effect_scale：爆発とエフェクトの長さの倍率（0なら出さない），bomb_cap：敵機の爆弾数の上限（Noneなら無制限），
+    # boss_cap：ボスの弾数の上限，interpolate：補間描画，scroll_every：dirtyモードで背景を進める間隔，
+    # hud_every：dirtyモードでHUDを描き直す間隔（scroll_everyとhud_everyは--dirtyのときだけ効く）
+    LEVELS = (
+        {"effect_scale": 1.0, "bomb_cap": None, "boss_cap": 120, "interpolate": True, "scroll_every": 50, "hud_every": 1},
+        {"effect_scale": 0.5, "bomb_cap": None, "boss_cap": 80, "interpolate": False, "scroll_every": 100, "hud_every": 2},
+        {"effect_scale": 0.25, "bomb_cap": 300, "boss_cap": 60, "interpolate": False, "scroll_every": 200, "hud_every": 5},
+        {"effect_scale": 0.0, "bomb_cap": 150, "boss_cap": 40, "interpolate": False, "scroll_every": 400, "hud_every": 10},
+    )
+
+    def __init__(self, budget: float = TICK, levels: tuple = LEVELS, degrade: float = 1.0, recover: float = 0.6,
+                 window: int = 30, hold: int = 120):
+        """
+        引数1 budget：1フレームの処理時間の予算（秒）
+        引数2 levels：レベルごとの設定の並び
+        引数3 degrade：平均が予算のこの倍を超えたら品質を下げる
+        引数4 recover：平均が予算のこの倍未満なら品質を戻す候補にする
+        引数5 window：平均をとるフレーム数
+        引数6 hold：品質を戻すまでにrecoverを下回り続けるフレーム数
+        """
+        self.budget = budget
+        self.levels = levels
+        self.degrade = degrade
+        self.recover = recover
+        self.times = collections.deque(maxlen=window)
+        self.hold = hold
+        self.calm = 0  # recoverを下回り続けたフレーム数
+        self.level = 0
+
+    @property
+    def settings(self) -> dict:
+        """
+        現在のレベルの設定
+        """
+        return self.levels[self.level]
+
+    def observe(self, seconds: float) -> bool:
+        """
+        1フレームの処理時間を記録し，必要ならレベルを変える
+        引数 seconds：描画までにかかった時間（待ち時間を除く）
+        戻り値：レベルを変えたかどうか
+        """
+        self.times.append(seconds)
+        if len(self.times) < self.times.maxlen:
+            return False
+        avg = sum(self.times)/len(self.times)
+        if avg > self.budget*self.degrade:
+            self.calm = 0
+            if self.level < len(self.levels)-1:
+                self.change(self.level+1, avg, "over")
+                return True
+        elif avg < self.budget*self.recover:
+            self.calm += 1
+            if self.calm >= self.hold and self.level > 0:
+                self.change(self.level-1, avg, "under")
+                return True
+        else:
+            self.calm = 0
+        return False
+
+    def change(self, level: int, avg: float, why: str):
+        """
+        レベルをlevelに変え，理由をログに残す
+        """
+        log.info("quality level %d -> %d: average frame %.1f ms is %s %.1f ms (budget %.1f ms)",
+                 self.level, level, 1000*avg, why,
+                 1000*self.budget*(self.degrade if why == "over" else self.recover), 1000*self.budget)
+        self.level = level
+        self.times.clear()
+        self.calm = 0
+
+    def apply(self, game: "Game", renderer: Renderer):
+        """
+        現在のレベルの設定をゲームと描画に反映する
+        """
+        settings = self.settings
+        game.effect_scale = settings["effect_scale"]
+        game.bomb_cap = settings["bomb_cap"]
+        game.pattern.cap = settings["boss_cap"]
+        renderer.scroll_every = settings["scroll_every"]
+        renderer.hud_every = settings["hud_every"]
+
+
+class Profiler:
+    """
+    1フレームの処理を区間ごとに計測し，直近の平均と最大，スプライト数を画面に重ねて表示するクラス
+    無効のときはstart()，lap()，end()がすぐに戻るだけなので，計測箇所を残しても負荷はほぼない
+    """
+    name = "overlay"
+
+    def __init__(self, groups: dict[str, pg.sprite.AbstractGroup] | None = None, window: int = 60):
+        """
+        引数1 groups：数を表示するスプライトグループの辞書
+        引数2 window：平均と最大を計算する直近のフレーム数
+        """
+        self.enabled = False
+        self.groups = groups or {}
+        self.history: dict[str, collections.deque] = {}  # 区間ごとの直近windowフレームの時間
+        self.window = window
+        self.frame: dict[str, float] = {}  # 計測中のフレームの区間ごとの時間
+        self.last = 0.0  # 前の区切りの時刻
+        self.font = None
+        self.image = None  # 表示用に描画した計測結果
+        self.frames = 0
+
+    def start(self):
+        """
+        フレームの計測を始める
+        """
+        if self.enabled:
+            self.last = time.perf_counter()
+
+    def lap(self, name: str, phase: str = ""):
+        """
+        前の区切りからの時間を区間phase:nameの時間に加える
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        key = f"{phase}:{name}" if phase else name
+        self.frame[key] = self.frame.get(key, 0.0)+now-self.last
+        self.last = now
+
+    def end(self):
+        """
+        フレームの計測を終え，区間ごとの時間を履歴に加える
+        """
+        if not self.enabled:
+            return
+        for key, t in self.frame.items():
+            if key not in self.history:
+                self.history[key] = collections.deque(maxlen=self.window)
+            self.history[key].append(t)
+        self.frame = {}
+        self.frames += 1
+
+    def report(self) -> dict[str, tuple[float, float]]:
+        """
+        区間ごとの直近の(平均, 最大)時間（ミリ秒）を辞書で返す
+        """
+        return {key: (1000*sum(h)/len(h), 1000*max(h)) for key, h in self.history.items() if h}
+
+    def update(self, screen: pg.Surface) -> pg.Rect:
+        """
+        計測結果を画面左上に表示する（文字の描画は10フレームに1回だけ行う）
+        引数 screen：画面Surface
+        戻り値：表示した領域
+        """
+        if self.image is None or self.frames%10 == 0:
+            if self.font is None:
+                self.font = pg.font.Font(None, 22)
+            lines = [f"{key:16s} {avg:6.2f} {peak:6.2f} ms" for key, (avg, peak) in self.report().items()]
+            lines.append("  ".join(f"{n}:{len(g)}" for n, g in self.groups.items()))
+            h = self.font.get_linesize()
+            self.image = pg.Surface((max(self.font.size(line)[0] for line in lines)+8, h*len(lines)+8))
+            self.image.set_alpha(200)
+            for i, line in enumerate(lines):
+                self.image.blit(self.font.render(line, True, (255, 255, 0)), (4, 4+i*h))
+        return screen.blit(self.image, (0, 0))
+
+
+class Keys:
+    """
+    pg.key.get_pressed()の代わりに使う押下キーの真理値表（ウィンドウなしでの実行用）
+    """
+    def __init__(self, pressed=()):
+        """
+        引数 pressed：押されているキー定数の並び
+        """
+        self.pressed = frozenset(pressed)
+
+    def __getitem__(self, key: int) -> bool:
+        return key in self.pressed
+
+
+NO_KEYS = Keys()  # 何も押していない状態
+MOVES = [(dx, dy) for dx in (-1, 0, +1) for dy in (-1, 0, +1)]  # 押さない(0, 0)を含む9通りの移動方向
+MOVE_KEYS = {  # 移動方向とその方向に動くように矢印キーを押したKeys
+    (dx, dy): Keys([k for k, mv in Plane.delta.items() if mv in ((dx, 0), (0, dy))])
+    for dx, dy in MOVES
+}
+
+
+class Scheduler:
+    """
+    (ステップ, 優先度, 順番)の小さい順にイベントを取り出すヒープ
+    毎ステップの処理は実行時刻になったイベントの数だけで済む
+    """
+    def __init__(self):
+        self.heap: list[tuple] = []
+        self.seq = itertools.count()  # 順番を指定しないイベントの登録順
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def at(self, tick: int, prio: int, action, *args, order: int | None = None):
+        """
+        ステップtickにaction(*args)を実行するよう登録する
+        引数1 tick：実行するステップ
+        引数2 prio：同じステップのイベントの実行順（小さいほど先）
+        引数3 action：呼び出す関数
+        引数4 order：同じ優先度のイベントの実行順（省略時は登録順）
+        """
+        heapq.heappush(self.heap, (tick, prio, next(self.seq) if order is None else order, action, args))
+
+    def run(self, tick: int):
+        """
+        ステップtickまでに実行時刻になったイベントを順に実行する
+        """
+        heap = self.heap
+        while heap and heap[0][0] <= tick:
+            _, _, _, action, args = heapq.heappop(heap)
+            action(*args)
+
+
+# 出現ウェーブ：(出現させるクラス, 追加するグループ名, 間隔（ステップ）, 出現条件)
+# 間隔の倍数のステップごとに，出現条件がNoneか真なら出現させる．同じステップでは上から順に出現する
+WAVES = (
+    (Enemy, "emys", 200, lambda game: len(game.bosses) < 1),  # ボスがいない間の追加の敵機
+    (Enemy2, "emys2", 100, lambda game: game.enemies_killed >= 10),  # 敵機を10体倒したら出現
+    (Boss, "bosses", 1, lambda game: game.enemies_killed > 30 and len(game.bosses) < 1),  # 30体より多く倒したら出現
+    (Enemy, "emys", 200, None),  # 200フレームに1回，敵機を出現させる
+    (Item, "items", 200, None),  # 200フレームに1回, 回復薬が出現する
+)
+FIRE_PRIO = {"emys": 0, "bosses": 1, "emys2": 2}  # 同じステップの爆弾投下はこのグループ順（ウェーブより後）
+
+
+class Game:
+    """
+    1ラウンド分のゲームの状態と，1フレーム分の進行（発射，出現，攻撃，衝突判定，移動）を扱うクラス
+    描画とイベント処理は行わないので，ウィンドウがなくても同じ進行を再現できる
+    """
+    def __init__(self, rng=random, soa: bool = False):
+        """
+        引数1 rng：出現位置などに使う乱数生成器（random.Randomまたはrandomモジュール）
+        引数2 soa：Trueなら弾をNumPy配列でまとめて動かすProjectileGroupに入れる
+        """
+        self.rng = rng
+        self.score = Score()
+        self.boss_hp = Boss_hp()
+        self.zanki = Zanki()
+        self.plane = Plane(3, (900, 400))
+        self.planes = pg.sprite.RenderUpdates(self.plane)
+        shots = ProjectileGroup if soa else pg.sprite.RenderUpdates  # 弾を入れるグループの型
+        self.bombs = shots()
+        self.beams = shots()
+        self.exps = pg.sprite.RenderUpdates()
+        self.emys = pg.sprite.RenderUpdates()
+        self.bosses = pg.sprite.RenderUpdates()
+        self.bossbombs = shots()
+        self.emys2 = pg.sprite.RenderUpdates()
+        self.items = pg.sprite.RenderUpdates()
+        self.enemies_killed = 0 #倒した敵カウンター
+        self.tmr = 0
+        self.hit = SpatialHash()
+        self.events = Scheduler()  # 出現と爆弾投下の予定
+        self.pattern = BossPattern()  # ボスの弾幕
+        self.effect_scale = 1.0  # 爆発とエフェクトの長さの倍率（0なら出さない）
+        self.bomb_cap = None  # 敵機の爆弾数の上限（Noneなら無制限）
+        self.spawned = itertools.count()  # 敵機の出現順（同じステップの爆弾投下をグループ内の順に行う）
+        self.descending: list[tuple[int, str, EnemyBase]] = []  # 降下中の(出現順, グループ名, 敵機)
+        for prio, (cls, name, every, cond) in enumerate(WAVES):
+            self.events.at(0, prio, self.spawn, prio, 0)
+        for name in ("planes", "beams", "emys", "emys2", "bosses", "bombs", "bossbombs", "exps", "items"):
+            getattr(self, name).name = name  # 計測結果の表示に使う名前
+        self.prof = Profiler({name: getattr(self, name)
+                              for name in ("beams", "bombs", "bossbombs", "emys", "emys2", "exps", "items")})
+        # 奥から順に並べた描画対象（スプライトグループとHUD）
+        self.layers = [self.planes, self.beams, self.emys, self.emys2, self.bosses, self.bombs,
+                       self.bossbombs, self.exps, self.score, self.boss_hp, self.zanki, self.items]
+
+    def fire(self):
+        """
+        スコアに応じてビームを発射する（スペースキー1回分）
+        """
+        plane, score, beams = self.plane, self.score, self.beams
+        if score.score < 200:
+            beams.add(Beam.acquire(plane, score.score))
+        elif 200 <= score.score:
+            beams.add(Beam.acquire(plane, score.score))
+            beams.add(Beam_up.acquire(plane, score.score))
+            beams.add(Beam_down.acquire(plane, score.score))
+
+    def spawn(self, wave: int, tick: int):
+        """
+        ウェーブWAVES[wave]の出現をステップtickに行い，次の出現を予定する
+        """
+        cls, name, every, cond = WAVES[wave]
+        self.events.at(tick+every, wave, self.spawn, wave, tick+every)
+        if cond is not None and not cond(self):
+            return
+        sprite = cls(self.rng)
+        getattr(self, name).add(sprite)
+        if isinstance(sprite, EnemyBase):
+            self.descending.append((next(self.spawned), name, sprite))
+
+    def drop(self, order: int, name: str, emy: EnemyBase, tick: int):
+        """
+        停止した敵機emyがステップtickに爆弾を投下し，次の投下を予定する（倒されていれば何もしない）
+        """
+        if not emy.alive():
+            return
+        if isinstance(emy, Boss):
+            every = self.pattern.fire(emy, self.plane, self.bossbombs, self.rng, tick)
+        else:
+            if self.bomb_cap is None or len(self.bombs) < self.bomb_cap:
+                self.bombs.add(Bomb.acquire(emy, self.plane, self.rng))
+            every = emy.interval
+        self.events.at(tick+every, len(WAVES)+FIRE_PRIO[name], self.drop, order, name, emy, tick+every, order=order)
+
+    def explode(self, obj: pg.sprite.Sprite, life: int, num: int | None = None):
+        """
+        objの位置に爆発（numを渡したらアイテムのエフェクト）をeffect_scale倍の長さで出す
+        """
+        life = int(life*self.effect_scale)
+        if life > 0:
+            self.exps.add(Explosion.acquire(obj, life) if num is None else Effect.acquire(obj, life, num))
+
+    def landed(self, tick: int):
+        """
+        ステップtickの移動で停止した敵機の最初の爆弾投下を，tickより後の投下間隔の倍数のステップに予定する
+        """
+        descending = []
+        for order, name, emy in self.descending:
+            if not emy.alive():
+                continue
+            if emy.state == DOWN:
+                descending.append((order, name, emy))
+                continue
+            every = emy.fire_every or emy.interval
+            first = (tick//every+1)*every
+            self.events.at(first, len(WAVES)+FIRE_PRIO[name], self.drop, order, name, emy, first, order=order)
+        self.descending = descending
+
+    def step(self, key_lst, shots: int = 0) -> str | None:
+        """
+        ゲームを1フレーム進める
+        引数1 key_lst：押下キーの真理値表（pg.key.get_pressed()またはKeys）
+        引数2 shots：このフレームでスペースキーが押された回数
+        戻り値：ゲームオーバーなら"gameover"，クリアなら"clear"，続くならNone
+        """
+        for _ in range(shots):
+            self.fire()
+        tmr, plane = self.tmr, self.plane
+        score, boss_hp, zanki = self.score, self.boss_hp, self.zanki
+        bombs, beams, exps, items = self.bombs, self.beams, self.exps, self.items
+        emys, emys2, bosses, bossbombs = self.emys, self.emys2, self.bosses, self.bossbombs
+        hit, prof = self.hit, self.prof
+
+        self.events.run(tmr)  # 出現と，停止した敵機の爆弾投下
+        prof.lap("spawn")
+
+        hit.build([beams, items, bombs, bossbombs])  # 衝突判定の相手側になるスプライトを登録する
+        for emy2 in hit.groupcollide(emys2, beams, True, True).keys():
+            self.explode(emy2, 100)  # 爆発エフェクト
             score.score_up(20)  # 10点アップ
-            enemies_killed += 2 #カウント２
+            self.enemies_killed += 2 #カウント２
 
 
-        for emy in pg.sprite.groupcollide(emys, beams, True, True).keys():
-            exps.add(Explosion(emy, 100))  # 爆発エフェクト
+        for emy in hit.groupcollide(emys, beams, True, True).keys():
+            self.explode(emy, 100)  # 爆発エフェクト
             score.score_up(10)  # 10点アップ
-            enemies_killed += 1 #カウント１
+            self.enemies_killed += 1 #カウント１
         
-        for boss in pg.sprite.groupcollide(bosses, beams, True, True).keys():
+        for boss in hit.groupcollide(bosses, beams, True, True).keys():
             boss_hp.hp_down(int(1))
             if boss_hp.boss_hp == 0:
-                exps.add(Explosion(boss, 400))  # 爆発エフェクト
+                self.explode(boss, 400)  # 爆発エフェクト
                 score.score_up(100)  # 10点アップ
             
 
-        for bomb in pg.sprite.groupcollide(bombs, beams, True, True).keys():
-            exps.add(Explosion(bomb, 50))  # 爆発エフェクト
+        for bomb in hit.groupcollide(bombs, beams, True, True).keys():
+            self.explode(bomb, 50)  # 爆発エフェクト
             score.score_up(1)  # 1点アップ
 
-        for bossbomb in pg.sprite.groupcollide(bossbombs,beams,True,True).keys():
-            exps.add(Explosion(bossbomb,400))
+        for bossbomb in hit.groupcollide(bossbombs, beams, True, True).keys():
+            self.explode(bossbomb, 400)
             score.score_up(3)
 
-        for item in pg.sprite.spritecollide(plane, items, True): # 回復薬と飛行機が接触する
+        for item in hit.spritecollide(plane, items, True): # 回復薬と飛行機が接触する
             if item.i != 0:  #回復薬に接触したとき
                 zanki.zanki_up(1)
-                exps.add(Effect(item, 50, item.i))
+                self.explode(item, 50, item.i)
             else: #毒薬に接触したとき
                 zanki.zanki_down(1)
-                exps.add(Effect(item, 50, item.i))
+                self.explode(item, 50, item.i)
 
-        for bomb in pg.sprite.spritecollide(plane, bombs, True):
+        for bomb in hit.spritecollide(plane, bombs, True)+hit.spritecollide(plane, bossbombs, True):
             if plane.state == "normal":
                 zanki.zanki_down(1) # 残機１なくなる
                 plane.change_state("hyper", 100)
                 if(zanki.zanki == 0):
-                    go.update(screen)  #ゲームオーバー表示
-                    score.update(screen)
-                    zanki.update(screen)
-                    pg.display.update()
-                    time.sleep(2)
-                    return
+                    return "gameover"
             if plane.state == "hyper":
-                exps.add(Explosion(bomb, 50))  
+                self.explode(bomb, 50)
         if boss_hp.boss_hp == 0:
-            cl.update(screen)
-            score.update(screen)
-            zanki.update(screen)
-            pg.display.update()
-            time.sleep(2)
-            return
+            return "clear"
+        prof.lap("collide")
+
+        plane.update(key_lst)
+        prof.lap("planes", "update")
+        for group in (beams, emys, emys2, bosses, bombs, bossbombs, exps, items):
+            group.update()
+            prof.lap(group.name, "update")
+        self.landed(tmr)
+        self.tmr += 1
+        return None
+
+    def summary(self) -> dict:
+        """
+        スコアなどの現在の状態を辞書で返す
+        checksumは全スプライトの位置から計算した値で，同じ進行なら必ず一致する
+        """
+        crc = 0
+        for layer in self.layers:
+            if isinstance(layer, pg.sprite.AbstractGroup):
+                for spr in layer.sprites():
+                    crc = zlib.crc32(repr(tuple(spr.rect)).encode(), crc)
+        return {
+            "frames": self.tmr,
+            "score": self.score.score,
+            "zanki": self.zanki.zanki,
+            "boss_hp": self.boss_hp.boss_hp,
+            "enemies_killed": self.enemies_killed,
+            "checksum": crc,
+        }
 
-        
-        x = tmr%6400
-        screen.blit(bg_img, [-x, 0])
-        screen.blit(bg_img2, [1600-x, 0])
-        screen.blit(bg_img, [3200-x, 0])
-        screen.blit(bg_img2, [4800-x, 0])
-        screen.blit(bg_img, [6400-x, 0])
-        plane.update(key_lst, screen)
-        beams.update()
-        beams.draw(screen)
-        emys.update()
-        emys.draw(screen)
-        emys2.update()
-        emys2.draw(screen)
-        bosses.update()
-        bosses.draw(screen)
-        bombs.update()
-        bombs.draw(screen)
-        bossbombs.update()
-        bossbombs.draw(screen)
-        exps.update()
-        exps.draw(screen)
-        score.update(screen)
-        boss_hp.update(screen)
-        zanki.update(screen)    
-        items.update()
-        items.draw(screen)
-        
+    def close(self):
+        """
+        ラウンドを捨てる前に呼び，全グループのスプライトをkillする
+        プールから取り出した弾や爆発をプールに戻し，次のラウンドで再利用できるようにする
+        """
+        for layer in self.layers:
+            if isinstance(layer, pg.sprite.AbstractGroup):
+                for spr in layer.sprites():
+                    spr.kill()
+
+
+class Script:
+    """
+    (フレーム数, 押すキーの並び, 発射するかどうか)の区間を順に繰り返す入力
+    Game.stepに渡す(key_lst, shots)を返す呼び出し可能オブジェクトとして使う
+    """
+    def __init__(self, segments: list[tuple[int, tuple[int, ...], bool]]):
+        self.frames = []  # フレームごとの(Keys, 発射回数)
+        for n, keys, fire in segments:
+            state = Keys(keys)
+            self.frames += [(state, int(fire))]*n
+
+    def __call__(self, game: Game) -> tuple[Keys, int]:
+        return self.frames[game.tmr%len(self.frames)]
+
+
+REPLAY_KEYS = (pg.K_UP, pg.K_DOWN, pg.K_LEFT, pg.K_RIGHT, pg.K_SPACE)  # リプレイに記録するキー（ビットの順）
+
+
+def write_varint(buf: bytearray, n: int):
+    """
+    0以上の整数nを7ビットずつの可変長でbufに書き足す
+    """
+    while n >= 0x80:
+        buf.append(n&0x7F | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    """
+    data[pos:]から可変長整数を読む
+    戻り値：(読んだ整数, 次の位置)
+    """
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b&0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+class Replay:
+    """
+    ステップごとの入力（REPLAY_KEYSの押下状態とSPACEのKEYDOWN回数）と乱数の種を記録・再生するクラス
+    ファイルには同じ入力が続く区間を(入力, 長さ)の可変長整数で書くので，長いプレイでも数KBに収まる
+    再生時はGame.stepに渡す(key_lst, shots)を返す呼び出し可能オブジェクトとして使う
+    """
+    MAGIC = b"MKRP"
+    VERSION = 1
+
+    def __init__(self, seed: int, checksum: int = 0):
+        """
+        引数1 seed：ゲームの乱数の種（可変長整数で書くので0以上）
+        引数2 checksum：記録終了時のGame.summary()["checksum"]（再生結果の照合用）
+        """
+        if seed < 0:  # 記録の最後に書き出せずに失敗しないよう，始める前に弾く
+            raise ValueError(f"リプレイの乱数の種は0以上にしてください（{seed}）")
+        self.seed = seed
+        self.checksum = checksum
+        self.ticks: list[int] = []  # ステップごとの入力（下位5ビットがキー，残りが発射回数）
+        self.keys: dict[int, Keys] = {}  # 入力ごとのKeysのキャッシュ
+
+    def __len__(self) -> int:
+        return len(self.ticks)
+
+    def record(self, key_lst, shots: int):
+        """
+        1ステップ分の入力を記録する
+        引数1 key_lst：押下キーの真理値リスト
+        引数2 shots：このステップに渡したSPACEのKEYDOWN回数
+        """
+        mask = 0
+        for i, k in enumerate(REPLAY_KEYS):
+            if key_lst[k]:
+                mask |= 1 << i
+        self.ticks.append(mask | shots << len(REPLAY_KEYS))
+
+    def __call__(self, game: Game) -> tuple[Keys, int]:
+        if game.tmr >= len(self.ticks):
+            return NO_KEYS, 0
+        value = self.ticks[game.tmr]
+        mask = value & (1 << len(REPLAY_KEYS))-1
+        if mask not in self.keys:
+            self.keys[mask] = Keys(k for i, k in enumerate(REPLAY_KEYS) if mask >> i & 1)
+        return self.keys[mask], value >> len(REPLAY_KEYS)
+
+    def save(self, path: str):
+        """
+        リプレイをpathに書き出す
+        """
+        buf = bytearray(self.MAGIC)
+        buf.append(self.VERSION)
+        runs = [(value, len(list(group))) for value, group in itertools.groupby(self.ticks)]
+        for n in (self.seed, self.checksum, len(runs)):
+            write_varint(buf, n)
+        for value, length in runs:
+            write_varint(buf, value)
+            write_varint(buf, length)
+        with open(path, "wb") as f:
+            f.write(buf)
+
+    @classmethod
+    def load(cls, path: str) -> "Replay":
+        """
+        pathからリプレイを読み込む
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:len(cls.MAGIC)] != cls.MAGIC or data[len(cls.MAGIC)] != cls.VERSION:
+            raise ValueError(f"{path}はリプレイファイルではありません")
+        pos = len(cls.MAGIC)+1
+        seed, pos = read_varint(data, pos)
+        checksum, pos = read_varint(data, pos)
+        count, pos = read_varint(data, pos)
+        replay = cls(seed, checksum)
+        for _ in range(count):
+            value, pos = read_varint(data, pos)
+            length, pos = read_varint(data, pos)
+            replay.ticks += [value]*length
+        return replay
+
+
+def null_input(game: Game) -> tuple[Keys, int]:
+    """
+    何も操作しない入力
+    """
+    return NO_KEYS, 0
+
+
+def setup_display(headless: bool = False) -> pg.Surface:
+    """
+    ウィンドウを作り，読み込み済みの画像を画面のピクセル形式に変換する
+    引数 headless：Trueならダミーのビデオドライバを使い，実際のウィンドウは開かない
+    戻り値：画面Surface
+    """
+    if headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+    start = time.perf_counter()
+    pg.init()
+    pg.display.set_caption("宇宙シューティング")
+    screen = pg.display.set_mode((WIDTH, HEIGHT))
+    ASSETS.convert_all()
+    STARTUP["display"] = time.perf_counter()-start
+    return screen
+
+
+def startup_report() -> dict[str, float]:
+    """
+    起動にかかった時間（秒）の内訳を返す
+    import：pygameとこのモジュールの読み込み，display：ウィンドウの生成，
+    assets：これまでの画像の読み込みと変換，first_frame：main開始から最初の画面更新まで
+    """
+    return {**STARTUP, "assets": ASSETS.seconds}
+
+
+def run_headless(frames: int, seed: int = 0, policy=null_input, soa: bool = False, render: bool = False) -> dict:
+    """
+    ウィンドウを開かず，フレームレートの制限なしでゲームを進める
+    乱数はseedで初期化した専用の生成器を使うので，同じ引数なら毎回同じ結果になる
+    引数1 frames：進める最大フレーム数（ゲームオーバー，クリアでも終わる）
+    引数2 seed：乱数の種
+    引数3 policy：policy(game)で(key_lst, shots)を返す入力（Script，null_inputなど）
+    引数4 soa：Trueなら弾をProjectileGroupに入れる
+    引数5 render：Trueなら毎フレーム画面Surfaceへの描画も行う
+    戻り値：Game.summary()に終了理由"result"，経過時間"seconds"，毎秒フレーム数"fps"を加えた辞書
+    """
+    screen = setup_display(headless=True)
+    game = Game(random.Random(seed), soa)
+    renderer = Renderer(screen, BgScroller(ASSETS.load("fig/Uchu.jpg")).draw) if render else None
+    result = None
+    start = time.perf_counter()
+    while game.tmr < frames and result is None:
+        key_lst, shots = policy(game)
+        result = game.step(key_lst, shots)
+        if renderer is not None:
+            renderer.draw_bg(screen, game.tmr)
+            renderer.draw_layers(game.layers)
+    seconds = time.perf_counter()-start
+    report = game.summary()
+    game.close()
+    report.update(result=result, seconds=seconds, fps=game.tmr/seconds if seconds else 0.0)
+    return report
+
+
+class Scene:
+    """
+    Appのフレームループから毎フレーム呼ばれる画面（タイトル，プレイ，結果）の基底クラス
+    どのシーンも1フレーム分の処理をして戻るので，待っている間もイベントを処理し続ける
+    """
+    def __init__(self, app: "App"):
+        self.app = app
+        self.age = 0.0  # シーンが始まってからの時間（秒）
+
+    def frame(self, dt: float, events: list[pg.event.Event]) -> "Scene | None":
+        """
+        1フレーム分進めて描画し，次のフレームのシーン（続けるならself，終わるならNone）を返す
+        引数1 dt：前のフレームからの経過時間（秒）
+        引数2 events：このフレームのイベント（QUITはAppが処理する）
+        """
+        raise NotImplementedError
+
+
+class TitleScene(Scene):
+    """
+    タイトル画面．スペースキーでプレイを始める
+    """
+    def __init__(self, app: "App"):
+        super().__init__(app)
+        self.title = app.text("SPACE SHOOTING", 100)
+        self.hint = app.text("Press SPACE to start", 40)
+
+    def frame(self, dt: float, events: list[pg.event.Event]) -> Scene | None:
+        self.age += dt
+        for event in events:
+            if event.type == pg.KEYDOWN and event.key == pg.K_SPACE:
+                return PlayScene(self.app)
+            if event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE:
+                return None
+        screen = self.app.screen
+        self.app.bg.draw(screen, int(self.age/TICK))
+        screen.blit(self.title, self.title.get_rect(center=(WIDTH//2, HEIGHT//2-60)))
+        if int(self.age*2)%2 == 0:  # 案内は点滅させる
+            screen.blit(self.hint, self.hint.get_rect(center=(WIDTH//2, HEIGHT//2+60)))
+        pg.display.update()
+        return self
+
+
+class PlayScene(Scene):
+    """
+    1ラウンドのプレイ画面．ゲームはTICKごとの固定ステップで進め，描画は間に合う限り何度でも行う
+    ゲームオーバーかクリアでResultSceneに移る
+    """
+    def __init__(self, app: "App"):
+        super().__init__(app)
+        self.seed = app.next_seed()
+        self.game = game = Game(random.Random(self.seed), app.soa)
+        self.renderer = Renderer(app.screen, app.bg.draw, app.dirty, prof=game.prof)
+        self.prof = game.prof  # F3キーで計測結果の表示を切り替える
+        self.prof.enabled = app.profile
+        self.recorder = Replay(self.seed) if app.record else None
+        self.interpolate = app.interpolate
+        if app.governor is not None:
+            app.governor.apply(game, self.renderer)
+            self.interpolate = app.interpolate and app.governor.settings["interpolate"]
+        self.acc = 0.0  # まだゲームに反映していない経過時間（秒）
+        self.prev = None  # 補間用の直前のステップ前の位置
+        self.shots = 0  # まだステップに渡していない発射回数
+
+    def frame(self, dt: float, events: list[pg.event.Event]) -> Scene | None:
+        app, game, prof, renderer = self.app, self.game, self.prof, self.renderer
+        start = time.perf_counter()
+        self.acc = min(self.acc+dt, MAX_STEPS*TICK)  # 処理落ちで溜まりすぎた分は捨てる
+        prof.start()
+        key_lst = pg.key.get_pressed()
+        for event in events:
+            if event.type == pg.KEYDOWN and event.key == pg.K_SPACE:
+                self.shots += 1
+            if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                prof.enabled = app.profile = not prof.enabled
+                prof.start()
+        prof.lap("events")
+
+        while self.acc >= TICK:
+            self.acc -= TICK
+            if self.interpolate and self.acc < TICK:  # 最後のステップの前の位置を補間用に記録する
+                self.prev = renderer.snapshot(game.layers)
+            if app.replay is not None:
+                if game.tmr >= len(app.replay):
+                    game.close()
+                    return None
+                key_lst, self.shots = app.replay(game)
+            if self.recorder is not None:
+                self.recorder.record(key_lst, self.shots)
+            result = game.step(key_lst, self.shots)
+            self.shots = 0
+            if result is not None:
+                self.finish()
+                return ResultScene(app, game, result)
+        alpha = self.acc/TICK if self.prev is not None else 1.0
+        renderer.render(game.tmr-2+alpha, game.layers+[prof] if prof.enabled else game.layers, alpha, self.prev)
+        prof.end()
+        if app.governor is not None and app.governor.observe(time.perf_counter()-start):
+            app.governor.apply(game, renderer)
+            self.interpolate = app.interpolate and app.governor.settings["interpolate"]
+            self.prev = None
+        return self
+
+    def finish(self):
+        """
+        ラウンドの記録を書き出す（記録中でなければ何もしない）
+        """
+        if self.recorder is not None:
+            self.recorder.checksum = self.game.summary()["checksum"]
+            self.recorder.save(self.app.record)
+            self.recorder = None
+
+
+class ResultScene(Scene):
+    """
+    ゲームオーバー・クリア画面．最後の盤面の上に結果を表示する
+    2秒後からスペースキーでもう一度プレイ，ESCキーでタイトルに戻る（記録・再生中は2秒後に終わる）
+    """
+    wait = 2.0  # 操作を受け付けるまでの時間（秒）
+
+    def __init__(self, app: "App", game: Game, result: str):
+        super().__init__(app)
+        self.game = game
+        self.msg = app.gameover if result == "gameover" else app.clear
+        self.hint = app.text("SPACE: play again   ESC: title", 40)
+
+    def frame(self, dt: float, events: list[pg.event.Event]) -> Scene | None:
+        self.age += dt
+        app = self.app
+        if self.age >= self.wait:
+            if app.record or app.replay is not None:
+                self.game.close()
+                return None
+            for event in events:
+                if event.type == pg.KEYDOWN and event.key in (pg.K_SPACE, pg.K_ESCAPE):
+                    self.game.close()  # 終わったラウンドの弾や爆発をプールに戻す
+                    return PlayScene(app) if event.key == pg.K_SPACE else TitleScene(app)
+        screen, game = app.screen, self.game
+        app.bg.draw(screen, game.tmr)
+        for layer in game.layers:
+            if isinstance(layer, pg.sprite.AbstractGroup):
+                layer.draw(screen)
+            else:
+                layer.update(screen)
+        self.msg.update(screen)
+        if self.age >= self.wait:
+            screen.blit(self.hint, self.hint.get_rect(center=(WIDTH//2, HEIGHT//2+60)))
         pg.display.update()
-        tmr += 1
-        clock.tick(50)
+        return self
+
+
+class App:
+    """
+    ウィンドウ，背景，読み込み済みの画像を保持し，シーンを切り替えながらフレームループを回すクラス
+    ラウンドをやり直しても画像はASSETSに残っているので，読み込み直さずにすぐ始められる
+    """
+    def __init__(self, dirty: bool = False, soa: bool = False, interpolate: bool = True, max_fps: int = 120,
+                 profile: bool = False, seed: int | None = None, record: str | None = None,
+                 replay: Replay | None = None, governor: Governor | None = None):
+        """
+        引数はmainと同じ
+        """
+        self.screen = setup_display()
+        self.bg = BgScroller(ASSETS.load("fig/Uchu.jpg")) #宇宙背景
+        self.gameover = gameover()
+        self.clear = clear()
+        self.font_cache: dict[tuple[str, int], pg.Surface] = {}
+        self.dirty = dirty
+        self.soa = soa
+        self.interpolate = interpolate
+        self.max_fps = max_fps
+        self.profile = profile
+        self.seed = replay.seed if replay is not None else seed
+        self.record = record
+        self.replay = replay
+        self.governor = governor
+        for vx, vy in MOVES:  # 8方向のビーム画像をループ前に用意しておく
+            if (vx, vy) != (0, 0):
+                ASSETS.variant("fig/beam.png", math.degrees(math.atan2(-vy, vx)), 1.0)
+        ASSETS.variant("fig/barrier.png", 0, 0.4)
+
+    def next_seed(self) -> int:
+        """
+        次のラウンドの乱数の種を返す（最初のラウンドだけ指定された種を使う）
+        """
+        seed, self.seed = self.seed, None
+        return random.randrange(2**32) if seed is None else seed
 
+    def text(self, text: str, size: int) -> pg.Surface:
+        """
+        白い文字列の画像を返す（同じ文字列と大きさは一度だけ描画する）
+        """
+        key = (text, size)
+        if key not in self.font_cache:
+            self.font_cache[key] = pg.font.Font(None, size).render(text, True, (255, 255, 255))
+        return self.font_cache[key]
+
+    def run(self, scene: Scene, start: float | None = None) -> int:
+        """
+        sceneからフレームループを回し，ウィンドウを閉じるかシーンがNoneを返したら0を返す
+        引数2 start：起動時刻（渡されたら最初のフレームまでの時間をSTARTUPに記録して表示する）
+        """
+        clock = pg.time.Clock()
+        last = time.perf_counter()
+        try:
+            while scene is not None:
+                now = time.perf_counter()
+                dt, last = now-last, now
+                events = pg.event.get()
+                if any(event.type == pg.QUIT for event in events):
+                    return 0
+                scene = scene.frame(dt, events)
+                if start is not None and "first_frame" not in STARTUP:
+                    STARTUP["first_frame"] = time.perf_counter()-start
+                    print(json.dumps(startup_report()))
+                clock.tick(self.max_fps)
+        finally:
+            if isinstance(scene, PlayScene):  # 途中で閉じたときも記録は残す
+                scene.finish()
+        return 0
+
+
+def seed_arg(text: str) -> int:
+    """
+    コマンドライン引数の乱数の種を0以上の整数として読む（リプレイファイルに書けるようにする）
+    """
+    seed = int(text)
+    if seed < 0:
+        raise argparse.ArgumentTypeError(f"乱数の種は0以上の整数にしてください: {text}")
+    return seed
+
+
+def main(dirty: bool = False, soa: bool = False, interpolate: bool = True, max_fps: int = 120,
+         profile: bool = False, seed: int | None = None, record: str | None = None, replay: Replay | None = None,
+         startup: bool = False, governor: Governor | None = None):
+    """
+    ゲームを実行する．タイトル→プレイ→ゲームオーバー・クリア→再プレイを，ウィンドウを閉じるまで繰り返す
+    記録・再生するときはタイトルを飛ばして1ラウンドだけ行う
+    引数1 dirty：Trueなら変化した領域だけをディスプレイに送るdirtyモードで描画する
+    引数2 soa：Trueなら弾をNumPy配列でまとめて動かすProjectileGroupに入れる
+    引数3 interpolate：Trueならステップ間の位置を補間して描画する
+    引数4 max_fps：描画の最大フレームレート（0なら制限しない）
+    引数5 profile：Trueなら処理ごとの時間を表示した状態で始める
+    引数6 seed：最初のラウンドの乱数の種（Noneならランダムに決める）
+    引数7 record：入力を記録するリプレイファイルのパス
+    引数8 replay：キー入力の代わりに再生するReplay（最後まで再生したら終わる）
+    引数9 startup：Trueなら最初の画面更新までの時間の内訳を表示する
+    引数10 governor：処理が間に合わないときに品質を下げるGovernor（Noneなら常に最高品質）
+    """
+    start = time.perf_counter()
+    app = App(dirty, soa, interpolate, max_fps, profile, seed, record, replay, governor)
+    scene = PlayScene(app) if record or replay is not None else TitleScene(app)
+    return app.run(scene, start if startup else None)
+
+
+STARTUP["import"] = time.perf_counter()-IMPORT_START
 
 if __name__ == "__main__":
-    pg.init()
-    main()
+    parser = argparse.ArgumentParser(description="宇宙シューティング")
+    parser.add_argument("--dirty", action="store_true", help="変化した領域だけを画面に送る")
+    parser.add_argument("--soa", action="store_true", help="弾をNumPy配列でまとめて動かす")
+    parser.add_argument("--no-interp", action="store_true", help="ステップ間の位置を補間せずに描画する")
+    parser.add_argument("--fps", type=int, default=120, help="描画の最大フレームレート（0なら制限しない）")
+    parser.add_argument("--profile", action="store_true", help="処理ごとの時間を画面に表示して始める（F3キーで切り替え）")
+    parser.add_argument("--pool-cap", type=int, help="クラスごとに再利用のため取っておくスプライトの上限数")
+    parser.add_argument("--headless", type=int, metavar="FRAMES", help="ウィンドウなし・速度制限なしでFRAMESフレーム進め，結果を表示する")
+    parser.add_argument("--seed", type=seed_arg, help="乱数の種（--headlessでは省略時0）")
+    parser.add_argument("--record", metavar="FILE", help="プレイの入力をリプレイファイルに記録する")
+    parser.add_argument("--replay", metavar="FILE", help="リプレイファイルの入力で再生する（--headlessと併用可）")
+    parser.add_argument("--render", action="store_true", help="--headlessでも毎フレーム描画する")
+    parser.add_argument("--startup", action="store_true", help="起動にかかった時間の内訳を表示する")
+    parser.add_argument("--no-governor", action="store_true", help="処理が間に合わなくても品質を下げない")
+    parser.add_argument("--governor", metavar="FILE", help="Governorの引数（budget，levelsなど）を書いたJSONファイル")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if args.pool_cap is not None:
+        for pool in POOLS.values():
+            pool.cap = args.pool_cap
+    replay = Replay.load(args.replay) if args.replay else None
+    governor = None
+    if not (args.no_governor or args.record or args.replay):  # 品質の変更は進行を変えるので，記録・再生中は使わない
+        config = {}
+        if args.governor:
+            with open(args.governor, encoding="utf-8") as f:
+                config = json.load(f)
+        governor = Governor(**config)
+    if args.headless is not None:
+        if replay is not None:
+            report = run_headless(min(args.headless, len(replay)) or len(replay), replay.seed, replay,
+                                  soa=args.soa, render=args.render)
+            report["replay_match"] = report["checksum"] == replay.checksum
+        else:
+            report = run_headless(args.headless, args.seed or 0, soa=args.soa, render=args.render)
+        if args.startup:
+            report["startup"] = startup_report()
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        main(dirty=args.dirty, soa=args.soa, interpolate=not args.no_interp, max_fps=args.fps,
+             profile=args.profile, seed=args.seed, record=args.record, replay=replay,
+             startup=args.startup, governor=governor)
     pg.quit()
     sys.exit()
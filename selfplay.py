@@ -0,0 +1,218 @@
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+import pygame as pg
+
+import bench
+import musou_kokaton as mk
+
+
+class Bot:
+    """
+    近くの爆弾を避け，安全なときは一番近い敵機にビームの向きを合わせて撃つ入力
+    Game.stepに渡す(key_lst, shots)を返す呼び出し可能オブジェクトとして使う
+    """
+    def __init__(self, horizon: int = 8, radius: int = 350, margin: int = 40, cooldown: int = 3):
+        """
+        引数1 horizon：爆弾の位置を予測するステップ数
+        引数2 radius：避ける対象にする爆弾までの距離
+        引数3 margin：この距離より余裕が小さくなる移動は危険とみなす
+        引数4 cooldown：発射の間隔（ステップ）
+        """
+        self.horizon = horizon
+        self.radius = radius
+        self.margin = margin
+        self.cooldown = cooldown
+
+    def threats(self, game: mk.Game) -> list[tuple[float, float, int, int, float]]:
+        """
+        飛行機からradius以内の爆弾の(中心x, 中心y, 1ステップの移動量x, y, 半径)のリストを返す
+        """
+        cx, cy = game.plane.rect.center
+        near = []
+        for group in (game.bombs, game.bossbombs):
+            for bomb in group.sprites():
+                bx, by = bomb.rect.center
+                if abs(bx-cx) < self.radius and abs(by-cy) < self.radius:
+                    near.append((bx, by, *bomb.move, bomb.rect.width/2))
+        return near
+
+    def clearance(self, game: mk.Game, move: tuple[int, int], near: list) -> float:
+        """
+        moveの方向に動き続けたとき，horizonステップ以内に最も近づく爆弾との余裕（距離-半径）を返す
+        画面外に出る移動は-inf
+        """
+        plane = game.plane
+        step = plane.speed
+        rect = plane.rect.move(step*move[0], step*move[1])
+        if mk.check_bound(rect) != (True, True):
+            return -math.inf
+        size = max(rect.width, rect.height)/2
+        best = math.inf
+        for k in range(1, self.horizon+1):
+            px, py = plane.rect.centerx+step*move[0]*k, plane.rect.centery+step*move[1]*k
+            for bx, by, vx, vy, rad in near:
+                gap = math.hypot(bx+vx*k-px, by+vy*k-py)-rad-size
+                if gap < best:
+                    best = gap
+        return best
+
+    @staticmethod
+    def target(game: mk.Game) -> pg.sprite.Sprite | None:
+        """
+        飛行機に一番近い敵機（Enemy，Enemy2，Boss）を返す
+        """
+        cx, cy = game.plane.rect.center
+        enemies = [*game.emys, *game.emys2, *game.bosses]
+        if not enemies:
+            return None
+        return min(enemies, key=lambda e: (e.rect.centerx-cx)**2+(e.rect.centery-cy)**2)
+
+    @staticmethod
+    def aim(dx: float, dy: float) -> tuple[tuple[int, int], float]:
+        """
+        (dx, dy)の向きに最も近い8方向と，その方向の直線から目標までの距離を返す
+        """
+        best = None
+        for d in mk.MOVES:
+            if d == (0, 0):
+                continue
+            norm = math.hypot(*d)
+            along = (dx*d[0]+dy*d[1])/norm
+            if along <= 0:
+                continue
+            off = abs(dx*d[1]-dy*d[0])/norm
+            if best is None or off < best[1]:
+                best = d, off
+        return best or ((+1, 0), math.inf)
+
+    def __call__(self, game: mk.Game) -> tuple[mk.Keys, int]:
+        plane = game.plane
+        near = self.threats(game)
+        enemy = self.target(game)
+        shots = int(game.tmr%self.cooldown == 0 and enemy is not None)
+        if enemy is None:
+            want, off = None, math.inf
+        else:
+            want, off = self.aim(enemy.rect.centerx-plane.rect.centerx, enemy.rect.centery-plane.rect.centery)
+        if near:
+            scores = {move: self.clearance(game, move, near) for move in mk.MOVES}
+            if scores[(0, 0)] < self.margin or (want is not None and scores.get(want, -math.inf) < self.margin):
+                return mk.MOVE_KEYS[max(mk.MOVES, key=scores.__getitem__)], shots
+        if want is None:
+            return mk.MOVE_KEYS[(0, 0)], 0
+        if off > 30:  # 直線からずれていれば，ずれが小さくなる向きに動く（向きが変わるので次に向き直す）
+            cx, cy = plane.rect.center
+            ex, ey = enemy.rect.center
+            move = min(mk.MOVES, key=lambda m: self.aim(ex-cx-plane.speed*m[0], ey-cy-plane.speed*m[1])[1])
+            return mk.MOVE_KEYS[move], 0
+        if plane.dire != want:  # 1ステップだけ向きたい方向に動いて向きを合わせる
+            return mk.MOVE_KEYS[want], 0
+        return mk.MOVE_KEYS[(0, 0)], shots
+
+
+def play(seed: int, frames: int, soa: bool) -> dict:
+    """
+    seedの乱数で1ゲームをBotに遊ばせ，結果を返す（ワーカープロセスで呼ぶ）
+    戻り値：生き残ったフレーム数，スコア，撃破数，ボス撃破，1ステップの処理時間，Botの判断時間などの辞書
+    """
+    game = mk.Game(random.Random(seed), soa)
+    bot = Bot()
+    result = None
+    times = []
+    thinks = []  # Botが入力を決めるのにかかった時間（ステップの処理時間には含めない）
+    while game.tmr < frames and result is None:
+        start = time.perf_counter()
+        key_lst, shots = bot(game)
+        mid = time.perf_counter()
+        result = game.step(key_lst, shots)
+        times.append((time.perf_counter()-mid)*1000)
+        thinks.append((mid-start)*1000)
+    game.close()
+    return {
+        "seed": seed,
+        "frames": game.tmr,
+        "score": game.score.score,
+        "kills": game.enemies_killed,
+        "zanki": game.zanki.zanki,
+        "boss_defeated": result == "clear",
+        "result": result,
+        "step_ms_mean": sum(times)/len(times) if times else 0.0,
+        "step_ms_p95": bench.percentile(times, 95),
+        "bot_ms_mean": sum(thinks)/len(thinks) if thinks else 0.0,
+    }
+
+
+def init_worker(pool_cap: int | None):
+    """
+    ワーカープロセスごとにダミーのウィンドウを作り，画像を変換できるようにする
+    """
+    mk.setup_display(headless=True)
+    if pool_cap is not None:
+        for pool in mk.POOLS.values():
+            pool.cap = pool_cap
+
+
+def aggregate(games: list[dict], seconds: float) -> dict:
+    """
+    ゲームごとの結果をまとめた統計を返す
+    """
+    def stats(key: str) -> dict[str, float]:
+        values = [g[key] for g in games]
+        return {
+            "mean": statistics.fmean(values),
+            "median": statistics.median(values),
+            "min": min(values),
+            "max": max(values),
+        }
+    return {
+        "games": len(games),
+        "seconds": seconds,
+        "games_per_sec": len(games)/seconds if seconds else 0.0,
+        "frames": stats("frames"),
+        "score": stats("score"),
+        "kills": stats("kills"),
+        "clear_rate": sum(g["boss_defeated"] for g in games)/len(games),
+        "gameover_rate": sum(g["result"] == "gameover" for g in games)/len(games),
+        "step_ms": {"mean": statistics.fmean(g["step_ms_mean"] for g in games),
+                    "p95": bench.percentile([g["step_ms_p95"] for g in games], 95)},
+        "bot_ms": {"mean": statistics.fmean(g["bot_ms_mean"] for g in games)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Botによる宇宙シューティングの並列自動プレイ")
+    parser.add_argument("--games", type=int, default=100, help="遊ばせるゲーム数")
+    parser.add_argument("--frames", type=int, default=10000, help="1ゲームの最大フレーム数")
+    parser.add_argument("--seed", type=int, default=0, help="最初のゲームの乱数の種（以降は1ずつ増やす）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="ワーカープロセス数")
+    parser.add_argument("--soa", action="store_true", help="弾をProjectileGroupに入れる")
+    parser.add_argument("--pool-cap", type=int, help="クラスごとに再利用のため取っておくスプライトの上限数")
+    parser.add_argument("--out", default="selfplay_results.json", help="結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    seeds = range(args.seed, args.seed+args.games)
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(args.workers, initializer=init_worker,
+                                                initargs=(args.pool_cap,)) as ex:
+        games = list(ex.map(play, seeds, [args.frames]*args.games, [args.soa]*args.games,
+                            chunksize=max(1, args.games//(4*args.workers))))
+    report = aggregate(games, time.perf_counter()-start)
+    print(f"{report['games']} games in {report['seconds']:.1f}s ({report['games_per_sec']:.1f} games/s)  "
+          f"frames {report['frames']['mean']:.0f}  score {report['score']['mean']:.1f}  "
+          f"kills {report['kills']['mean']:.1f}  clear {report['clear_rate']:.1%}  "
+          f"step {report['step_ms']['mean']:.2f}ms  bot {report['bot_ms']['mean']:.2f}ms")
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"options": vars(args), "summary": report, "games": games}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit()